@@ -1,124 +1,149 @@
-import requests
+import aiohttp
 import asyncio
+import hashlib
+import json
 import os
+import sys
+
+from state_store import atomic_write
 
 API_SEED_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=seed'
 API_GEAR_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=gear'
 API_EGG_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=egg'
 API_WEATHER = 'https://api.joshlei.com/v2/growagarden/weather'
 
-def fetch_seed_info():
-    return requests.get(API_SEED_INFO).json()
+MANIFEST_FILE = 'assets/manifest.json'
+DOWNLOAD_CONCURRENCY = 16
+REQUEST_TIMEOUT = 30
+
+async def fetch_json(session, url):
+    async with session.get(url) as response:
+        response.raise_for_status()
+        return await response.json(content_type=None)
+
+async def fetch_seed_info(session):
+    return await fetch_json(session, API_SEED_INFO)
 
-def fetch_gear_info():
-    return requests.get(API_GEAR_INFO).json()
+async def fetch_gear_info(session):
+    return await fetch_json(session, API_GEAR_INFO)
 
-def fetch_egg_info():
-    return requests.get(API_EGG_INFO).json()
+async def fetch_egg_info(session):
+    return await fetch_json(session, API_EGG_INFO)
 
-def fetch_weather():
-    return requests.get(API_WEATHER).json().get('weather', [])
+async def fetch_weather(session):
+    return (await fetch_json(session, API_WEATHER)).get('weather', [])
 
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-async def get_images():
-    ensure_dir('assets/seed')
-    ensure_dir('assets/gear')
-    ensure_dir('assets/egg')
-    ensure_dir('assets/weather')
+def load_manifest():
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    return {}
 
-    seed_items = fetch_seed_info()
-    gear_items = fetch_gear_info()
-    egg_items = fetch_egg_info()
-    weather_items = fetch_weather()
+def save_manifest(manifest):
+    atomic_write(MANIFEST_FILE, json.dumps(manifest, indent=2, sort_keys=True).encode())
 
-    saved = {'seed': 0, 'gear': 0, 'egg': 0, 'weather': 0}
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
-    for item in seed_items:
-        if item.get('last_seen') == '0':
-            continue
-        
-        image_url = item.get('icon')
-        if image_url:
-            try:
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    with open(f'assets/seed/{item.get("item_id")}.png', 'wb') as f:
-                        f.write(image_response.content)
-                    print(f'Saved seed/{item.get("item_id")}.png')
-                    saved['seed'] += 1
-                else:
-                    print(f'Failed to fetch image for seed {item.get("item_id")}: {image_response.status_code}')
-            except Exception as e:
-                print(f'Error fetching image for seed {item.get("item_id")}: {e}')
-        else:
-            print(f'No image URL found for seed {item.get("item_id")}')
-
-    for item in gear_items:
-        if item.get('last_seen') == '0':
-            continue
-        
-        image_url = item.get('icon')
-        if image_url:
-            try:
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    with open(f'assets/gear/{item.get("item_id")}.png', 'wb') as f:
-                        f.write(image_response.content)
-                    print(f'Saved gear/{item.get("item_id")}.png')
-                    saved['gear'] += 1
-                else:
-                    print(f'Failed to fetch image for gear {item.get("item_id")}: {image_response.status_code}')
-            except Exception as e:
-                print(f'Error fetching image for gear {item.get("item_id")}: {e}')
-        else:
-            print(f'No image URL found for gear {item.get("item_id")}')
-
-    for item in egg_items:
-        if item.get('last_seen') == '0':
-            continue
-        
-        image_url = item.get('icon')
-        if image_url:
-            try:
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    with open(f'assets/egg/{item.get("item_id")}.png', 'wb') as f:
-                        f.write(image_response.content)
-                    print(f'Saved egg/{item.get("item_id")}.png')
-                    saved['egg'] += 1
-                else:
-                    print(f'Failed to fetch image for egg {item.get("item_id")}: {image_response.status_code}')
-            except Exception as e:
-                print(f'Error fetching image for egg {item.get("item_id")}: {e}')
-        else:
-            print(f'No image URL found for egg {item.get("item_id")}')
-
-    for item in weather_items:
-        if item.get('last_seen') == '0':
-            continue
-        
-        image_url = item.get('icon')
-        weather_id = item.get('weather_id')
-        if image_url and weather_id:
-            try:
-                image_response = requests.get(image_url)
-                if image_response.status_code == 200:
-                    with open(f'assets/weather/{weather_id}.png', 'wb') as f:
-                        f.write(image_response.content)
-                    print(f'Saved weather/{weather_id}.png')
-                    saved['weather'] += 1
+async def sync_image(session, semaphore, manifest, category, item_id, image_url, full):
+    """Download one icon if it is new or changed and return 'saved', 'unchanged' or 'failed'"""
+    key = f'{category}/{item_id}'
+    path = f'assets/{key}.png'
+    entry = manifest.get(key)
+    current_hash = file_hash(path)
+
+    headers = {}
+    if not full and entry and entry.get('url') == image_url and entry.get('sha256') == current_hash:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        if not headers:
+            # Nothing to revalidate with: trust the manifest until the URL changes or --full is passed
+            return 'unchanged'
+
+    try:
+        async with semaphore:
+            async with session.get(image_url, headers=headers) as image_response:
+                if image_response.status == 304:
+                    return 'unchanged'
+                if image_response.status != 200:
+                    print(f'Failed to fetch image for {category} {item_id}: {image_response.status}')
+                    return 'failed'
+                content = await image_response.read()
+                etag = image_response.headers.get('ETag')
+                last_modified = image_response.headers.get('Last-Modified')
+    except Exception as e:
+        print(f'Error fetching image for {category} {item_id}: {e}')
+        return 'failed'
+
+    content_hash = hashlib.sha256(content).hexdigest()
+    manifest[key] = {'url': image_url, 'etag': etag, 'last_modified': last_modified, 'sha256': content_hash}
+    if content_hash == current_hash:
+        return 'unchanged'
+
+    await asyncio.to_thread(atomic_write, path, content)
+    print(f'Saved {key}.png')
+    return 'saved'
+
+async def get_images(full=False):
+    for category in ('seed', 'gear', 'egg', 'weather'):
+        ensure_dir(f'assets/{category}')
+
+    manifest = {} if full else load_manifest()
+    semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        seed_items, gear_items, egg_items, weather_items = await asyncio.gather(
+            fetch_seed_info(session),
+            fetch_gear_info(session),
+            fetch_egg_info(session),
+            fetch_weather(session),
+        )
+
+        jobs = []
+        categories = []
+        for category, items, id_key in (
+            ('seed', seed_items, 'item_id'),
+            ('gear', gear_items, 'item_id'),
+            ('egg', egg_items, 'item_id'),
+            ('weather', weather_items, 'weather_id'),
+        ):
+            for item in items:
+                if item.get('last_seen') == '0':
+                    continue
+                image_url = item.get('icon')
+                item_id = item.get(id_key)
+                if image_url and item_id:
+                    jobs.append(sync_image(session, semaphore, manifest, category, item_id, image_url, full))
+                    categories.append(category)
                 else:
-                    print(f'Failed to fetch image for weather {weather_id}: {image_response.status_code}')
-            except Exception as e:
-                print(f'Error fetching image for weather {weather_id}: {e}')
-        else:
-            print(f'No image URL found for weather {weather_id}')
+                    print(f'No image URL found for {category} {item_id}')
+
+        results = await asyncio.gather(*jobs)
+
+    save_manifest(manifest)
+
+    saved = {'seed': 0, 'gear': 0, 'egg': 0, 'weather': 0}
+    unchanged = 0
+    for category, result in zip(categories, results):
+        if result == 'saved':
+            saved[category] += 1
+        elif result == 'unchanged':
+            unchanged += 1
 
     print('\nSummary:')
     for k, v in saved.items():
         print(f'{k.capitalize()} images saved: {v}')
+    print(f'Unchanged images skipped: {unchanged}')
 
 if __name__ == "__main__":
-    asyncio.run(get_images())
+    asyncio.run(get_images(full='--full' in sys.argv))
@@ -1,52 +1,129 @@
 import os
-import json
+import glob
+import shutil
 import asyncio
-import requests
 from datetime import datetime, timezone
+from typing import Optional
 from dotenv import load_dotenv
 import discord
+from discord import app_commands
 from discord.ext import tasks
 import time
+import functools
+import io
 import config
 import math
+import logging
+import http_client
+import response_cache
+from stock_feed import StockFeed, StockSnapshot, freeze, thaw
+from state_store import StateStore
+from message_cache import MessageCache, embed_fingerprint
+from scheduler import Scheduler
+from subscriptions import FEEDS, SubscriptionRegistry, guild_key
+from fanout import FanoutDispatcher
+from outbound import OutboundQueue
+from webhooks import WebhookBackend
+from alerts import AlertEngine, alert_message, build_role_index
+from watchlist import MAX_WATCHES_PER_USER, DirectMessenger, Watchlist
+from stock_delta import diff_stock, stock_categories
+from history import HistoryStore
+from rotation import RotationTracker
+from item_index import ItemIndex
+from embed_pager import add_line_fields, page_key, paginate
+from resilience import CircuitBreaker, Endpoint
+from cluster import LeaderLock, SnapshotHub, follow
+from stream import StreamSource
+import stock_cards
+import metrics
 
 load_dotenv()
 DISCORD_TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 JS_TOKEN = os.getenv('JS_TOKEN')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+STREAM_URL = os.getenv('STREAM_URL')
+STOCK_CARDS = os.getenv('STOCK_CARDS', '1') != '0'
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()]
 
 HEADERS = {'accept': 'application/json', 'jstudio-key': JS_TOKEN}
 
-STOCK_UPDATES_CHANNEL_ID = config.STOCK_UPDATES_CHANNEL_ID
-WEATHER_UPDATES_CHANNEL_ID = config.WEATHER_UPDATES_CHANNEL_ID
-TRAVELING_MERCHANT_CHANNEL_ID = config.TRAVELING_MERCHANT_CHANNEL_ID
-SEED_CHANNEL_ID = config.SEED_CHANNEL_ID
-GEAR_CHANNEL_ID = config.GEAR_CHANNEL_ID
-EGG_CHANNEL_ID = config.EGG_CHANNEL_ID
-WEATHER_CHANNEL_ID = config.WEATHER_CHANNEL_ID
-
-def ensure_data_directory():
-    """Ensure the data directory exists"""
-    if not os.path.exists('data'):
-        os.makedirs('data')
-
-ensure_data_directory()
-
-MESSAGE_ID_FILE = 'data/message_ids.json'
-
-def load_message_ids():
-    if os.path.exists(MESSAGE_ID_FILE):
-        with open(MESSAGE_ID_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_message_ids(ids):
-    with open(MESSAGE_ID_FILE, 'w') as f:
-        json.dump(ids, f)
-
-message_ids = load_message_ids()
+CONFIG_CHANNELS = {
+    'stock': config.STOCK_UPDATES_CHANNEL_ID,
+    'eventshop': config.EVENTSHOP_STOCK_CHANNEL_ID,
+    'merchant': config.TRAVELING_MERCHANT_CHANNEL_ID,
+    'seed': config.SEED_CHANNEL_ID,
+    'gear': config.GEAR_CHANNEL_ID,
+    'egg': config.EGG_CHANNEL_ID,
+    'weather': config.WEATHER_CHANNEL_ID,
+    'weather_updates': config.WEATHER_UPDATES_CHANNEL_ID,
+}
+LEGACY_MESSAGE_KEYS = {
+    'stock': ('stock_seed', 'stock_gear', 'stock_egg'),
+    'eventshop': ('stock_eventshop',),
+    'merchant': ('merchant',),
+    'seed': ('seed',),
+    'gear': ('gear',),
+    'egg': ('egg',),
+    'weather': ('weather',),
+}
+
+MESSAGE_ID_FILE = 'message_ids.json'
+LAST_SEEN_STOCK_FILE = 'last_seen_stock.json'
+ACTIVE_WEATHER_FILE = 'active_weather.json'
+FINGERPRINT_FILE = 'fingerprints.json'
+SUBSCRIPTION_FILE = 'subscriptions.json'
+ALERT_FILE = 'sent_alerts.json'
+ROTATION_FILE = 'rotations.json'
+WATCH_FILE = 'watchlist.json'
+WATCH_NOTICE_FILE = 'watch_notices.json'
+WEBHOOK_FILE = 'webhooks.json'
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Each sharded process keeps its own message ids and delivery state, seeded from data/ on first start.
+# DMs are not tied to a guild, so existing watchlists only go to the process running shard 0; copying
+# them everywhere would DM each watcher once per process.
+DATA_DIR = f"data/shard-{'-'.join(map(str, SHARD_IDS))}" if SHARD_IDS else 'data'
+if DATA_DIR != 'data' and not os.path.exists(DATA_DIR):
+    os.makedirs(DATA_DIR)
+    for path in glob.glob('data/*.json'):
+        if os.path.basename(path) in (WATCH_FILE, WATCH_NOTICE_FILE) and 0 not in SHARD_IDS:
+            continue
+        shutil.copy(path, DATA_DIR)
+
+state = StateStore(DATA_DIR)
+history = HistoryStore(os.path.join(DATA_DIR, 'history.db'))
+
+message_ids = state.load(MESSAGE_ID_FILE, {})
+last_seen_stock = state.load(LAST_SEEN_STOCK_FILE, {
+    'seed': [], 'gear': [], 'egg': [], 'eventshop': [], 'merchant': {},
+    'merchant_info': {'merchantName': None, 'stock_ids': [], 'active_window': [0, 0]}
+})
+last_seen_weather = state.load(ACTIVE_WEATHER_FILE, {'active_weathers': []})
+fingerprints = state.load(FINGERPRINT_FILE, {})
+message_cache = MessageCache(message_ids, fingerprints)
+rotation_tracker = RotationTracker(state.load(ROTATION_FILE, {}))
+subscriptions = SubscriptionRegistry(state.load(SUBSCRIPTION_FILE, {}))
+alert_engine = AlertEngine(
+    build_role_index((config.RARE_SEED_ROLES, config.RARE_GEAR_ROLES, config.RARE_EGG_ROLES)),
+    state.load(ALERT_FILE, {})
+)
+watchlist = Watchlist(state.load(WATCH_FILE, {}), state.load(WATCH_NOTICE_FILE, {}))
+webhooks = WebhookBackend(state.load(WEBHOOK_FILE, {}))
+# Last stock snapshot, info responses, job deadlines and command hash, so restarts pick up where they left off
+checkpoint = state.load(CHECKPOINT_FILE, {'stock': None, 'responses': {}, 'due': {}, 'commands': None})
+response_cache.restore(checkpoint['responses'])
 
 intents = discord.Intents.default()
-client = discord.Client(intents=intents)
+# Long rate limits raise instead of sleeping so the outbound queue only pauses that bucket
+if SHARD_COUNT:
+    client = discord.AutoShardedClient(
+        intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS or None, max_ratelimit_timeout=30
+    )
+else:
+    client = discord.Client(intents=intents, max_ratelimit_timeout=30)
+tree = app_commands.CommandTree(client)
 
 API_STOCK = 'https://api.joshlei.com/v2/growagarden/stock'
 API_EGG_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=egg'
@@ -55,23 +132,37 @@ API_GEAR_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=gear'
 API_WEATHER = 'https://api.joshlei.com/v2/growagarden/weather'
 API_WEATHER_INFO = 'https://api.joshlei.com/v2/growagarden/info?type=weather'
 
-def fetch_stock_api():
-    return requests.get(API_STOCK, headers=HEADERS).json()
+api_breaker = CircuitBreaker()
+
+def unchanged(cached):
+    return cached[0], False
 
-def fetch_egg_info_api():
-    return requests.get(API_EGG_INFO, headers=HEADERS).json()
+stock_endpoint = Endpoint('stock', api_breaker)
+egg_info_endpoint = Endpoint('egg info', api_breaker, stale=unchanged)
+seed_info_endpoint = Endpoint('seed info', api_breaker, stale=unchanged)
+gear_info_endpoint = Endpoint('gear info', api_breaker, stale=unchanged)
+weather_endpoint = Endpoint('weather', api_breaker)
+weather_info_endpoint = Endpoint('weather info', api_breaker, stale=unchanged)
 
-def fetch_seed_info_api():
-    return requests.get(API_SEED_INFO, headers=HEADERS).json()
+async def fetch_stock_api():
+    return await stock_endpoint.call(lambda: http_client.fetch_json(API_STOCK, headers=HEADERS))
 
-def fetch_gear_info_api():
-    return requests.get(API_GEAR_INFO, headers=HEADERS).json()
+async def fetch_egg_info_api():
+    return await egg_info_endpoint.call(lambda: response_cache.fetch_if_changed(API_EGG_INFO, headers=HEADERS))
 
-def fetch_weather_api():
-    return requests.get(API_WEATHER, headers=HEADERS).json()
+async def fetch_seed_info_api():
+    return await seed_info_endpoint.call(lambda: response_cache.fetch_if_changed(API_SEED_INFO, headers=HEADERS))
 
-def fetch_weather_info_api():
-    return requests.get(API_WEATHER_INFO, headers=HEADERS).json()
+async def fetch_gear_info_api():
+    return await gear_info_endpoint.call(lambda: response_cache.fetch_if_changed(API_GEAR_INFO, headers=HEADERS))
+
+async def fetch_weather_api():
+    return await weather_endpoint.call(lambda: http_client.fetch_json(API_WEATHER, headers=HEADERS))
+
+async def fetch_weather_info_api():
+    return await weather_info_endpoint.call(lambda: response_cache.fetch_if_changed(API_WEATHER_INFO, headers=HEADERS))
+
+stock_feed = StockFeed(fetch_stock_api)
 
 def get_emoji(item_id):
     emoji_id = config.EMOJI_IDS.get(item_id)
@@ -79,6 +170,16 @@ def get_emoji(item_id):
         return f'<:{item_id}:{emoji_id}>'
     return ''
 
+@functools.lru_cache(maxsize=1024)
+def item_label(item_id, display_name):
+    return f"{get_emoji(item_id)} {display_name}"
+
+def warm_item_labels(items):
+    """Render the label of every catalogue item ahead of time so rotation embeds are pure lookups"""
+    for item in items:
+        item_id = item.get('item_id', 'unknown')
+        item_label(item_id, item.get('display_name', item.get('item_id', 'Unknown')))
+
 def build_embed(title, items, color=0x8e44ad, time_key='start_date_unix'):
     embed = discord.Embed(title=title, color=color, timestamp=datetime.now(timezone.utc))
     description_lines = []
@@ -90,7 +191,7 @@ def build_embed(title, items, color=0x8e44ad, time_key='start_date_unix'):
         qty = item.get('quantity', '-')
         t_end = item.get('end_date_unix')
 
-        name = f"{get_emoji(item_id)} {display_name} **{qty}x**"
+        name = f"{item_label(item_id, display_name)} **{qty}x**"
         description_lines.append(name)
         
         if t_end:
@@ -105,8 +206,8 @@ def build_embed(title, items, color=0x8e44ad, time_key='start_date_unix'):
     
     return embed
 
-def build_info_embed(title, items, color=0x8e44ad, time_key='last_seen'):
-    embed = discord.Embed(title=title, color=color, timestamp=datetime.now(timezone.utc))
+def build_info_pages(title, items, color=0x8e44ad, time_key='last_seen'):
+    timestamp = datetime.now(timezone.utc)
     lines = []
     for item in items:
         t = item.get(time_key)
@@ -114,7 +215,7 @@ def build_info_embed(title, items, color=0x8e44ad, time_key='last_seen'):
             continue
         item_id = item.get('item_id', 'unknown')
         display_name = item.get('display_name', item.get('item_id', 'Unknown'))
-        name = f"{get_emoji(item_id)} {display_name}"
+        name = item_label(item_id, display_name)
         if t and t != 0 and t != '0':
             t_fmt = f'<t:{t}:R>'
         else:
@@ -122,14 +223,8 @@ def build_info_embed(title, items, color=0x8e44ad, time_key='last_seen'):
         lines.append(f'{name} {t_fmt}')
     
     if lines:
-        description = '\n'.join(lines)
-        if len(description) > 4000:
-            description = '\n'.join(lines[:50]) + f'\n\n... and {len(lines) - 50} more items'
-        embed.description = description
-    else:
-        embed.description = "No recent activity found."
-    
-    return embed
+        return paginate(title, lines, color, timestamp=timestamp)
+    return [[discord.Embed(title=title, color=color, timestamp=timestamp, description="No recent activity found.")]]
 
 def build_weather_embed(weather_data):
     if not weather_data:
@@ -155,34 +250,165 @@ def build_weather_embed(weather_data):
 
     return embed
 
-def get_mention_for_item(item_id, category):
-    if category == 'seed':
-        role_id = config.RARE_SEED_ROLES.get(item_id)
-    elif category == 'gear':
-        role_id = config.RARE_GEAR_ROLES.get(item_id)
-    elif category == 'egg':
-        role_id = config.RARE_EGG_ROLES.get(item_id)
-    else:
-        role_id = None
-    return f'<@&{role_id}>' if role_id else ''
-
-async def send_or_edit(channel, embed, key, mention=None):
-    global message_ids
-    msg_id = message_ids.get(key)
-    msg = None
-    if msg_id:
+DISCORD_LATENCY = metrics.Histogram('walnut_discord_request_seconds', 'Latency of Discord message requests', ('action',))
+DISCORD_RATE_LIMITS = metrics.Counter('walnut_discord_rate_limits_total', 'Discord 429 responses')
+ROTATION_PUBLISH_LATENCY = metrics.Histogram(
+    'walnut_rotation_publish_seconds', 'Delay between a stock rotation boundary and its publish'
+)
+metrics.Gauge('walnut_message_cache_hits', 'Message handles reused from the cache', function=lambda: message_cache.hits)
+metrics.Gauge('walnut_message_cache_misses', 'Message handles built from a stored id', function=lambda: message_cache.misses)
+metrics.Gauge('walnut_message_edits_skipped', 'Edits skipped because the fingerprint matched', function=lambda: message_cache.skipped)
+metrics.Gauge(
+    'walnut_message_cache_hit_ratio', 'Share of message lookups served from the handle cache',
+    function=lambda: message_cache.hits / max(1, message_cache.hits + message_cache.misses)
+)
+
+class RateLimitCounter(logging.Handler):
+    """Counts the 429 warnings discord.py logs before it retries a request"""
+
+    def emit(self, record):
+        if 'rate limited' in record.getMessage():
+            DISCORD_RATE_LIMITS.inc()
+
+logging.getLogger('discord.http').addHandler(RateLimitCounter(logging.WARNING))
+
+def card_files(cards):
+    # discord.File is consumed by one request, so wrap the shared PNG bytes afresh for every send
+    return [discord.File(io.BytesIO(data), filename=filename) for filename, data in cards or ()]
+
+async def send_or_edit(channel, embeds, key, mention=None, cards=None):
+    content = mention if mention else None
+    if not isinstance(embeds, list):
+        embeds = [embeds]
+    fingerprint = embed_fingerprint(embeds, content)
+    if message_cache.is_current(key, fingerprint):
+        return
+    webhook = webhooks.for_channel(channel.id)
+    if webhook is not None:
         try:
-            msg = await channel.fetch_message(msg_id)
-            await msg.edit(content=mention if mention else None, embed=embed)
+            await send_or_edit_webhook(webhook, channel, content, embeds, key, fingerprint, cards)
             return
-        except Exception:
+        except discord.NotFound:
+            print(f"Webhook for channel {channel.id} was deleted, posting as the bot")
+            webhooks.remove(channel.id)
+            state.mark_dirty(WEBHOOK_FILE)
+    if webhooks.owner(key) is not None:
+        # The bot cannot edit a webhook's message, so replace it
+        await delete_message(channel, key)
+    msg = message_cache.get(channel, key)
+    if msg is not None:
+        try:
+            with DISCORD_LATENCY.time(action='edit'):
+                await msg.edit(content=content, embeds=embeds, attachments=card_files(cards))
+            message_cache.put(key, msg, fingerprint)
+            state.mark_dirty(FINGERPRINT_FILE)
+            return
+        except (discord.NotFound, discord.Forbidden):
+            message_cache.invalidate(key)
+    with DISCORD_LATENCY.time(action='send'):
+        msg = await channel.send(content=content, embeds=embeds, files=card_files(cards))
+    message_cache.put(key, msg, fingerprint)
+    state.mark_dirty(MESSAGE_ID_FILE)
+    state.mark_dirty(FINGERPRINT_FILE)
+
+async def send_or_edit_webhook(webhook, channel, content, embeds, key, fingerprint, cards=None):
+    message_id = message_ids.get(key)
+    if message_id and webhooks.owner(key) != webhook.id:
+        # Posted by the bot or an older webhook, which this webhook cannot edit
+        await delete_message(channel, key)
+        message_id = None
+    with DISCORD_LATENCY.time(action='webhook'):
+        message_id = await webhooks.send_or_edit(
+            webhook, message_id, key, files=lambda: card_files(cards), content=content, embeds=embeds
+        )
+    message_cache.record(key, message_id, fingerprint)
+    state.mark_dirty(MESSAGE_ID_FILE)
+    state.mark_dirty(FINGERPRINT_FILE)
+    state.mark_dirty(WEBHOOK_FILE)
+
+async def post_message(channel, **kwargs):
+    """Post a new message through the channel's webhook when it has one, otherwise as the bot"""
+    webhook = webhooks.for_channel(channel.id)
+    if webhook is not None:
+        try:
+            return await webhook.send(wait=True, **kwargs)
+        except discord.NotFound:
+            webhooks.remove(channel.id)
+            state.mark_dirty(WEBHOOK_FILE)
+    return await channel.send(**kwargs)
+
+async def delete_message(channel, key):
+    webhook = webhooks.for_channel(channel.id)
+    if key in message_ids and webhook is not None and webhooks.owner(key) == webhook.id:
+        with DISCORD_LATENCY.time(action='delete'):
+            await webhooks.delete(webhook, message_ids[key], key)
+        message_cache.forget(key)
+        state.mark_dirty(MESSAGE_ID_FILE)
+        state.mark_dirty(FINGERPRINT_FILE)
+        state.mark_dirty(WEBHOOK_FILE)
+        return
+    if webhooks.owners.pop(key, None) is not None:
+        state.mark_dirty(WEBHOOK_FILE)
+    msg = message_cache.get(channel, key)
+    if msg is not None:
+        try:
+            with DISCORD_LATENCY.time(action='delete'):
+                await msg.delete()
+        except (discord.NotFound, discord.Forbidden):
             pass
-    msg = await channel.send(content=mention if mention else None, embed=embed)
-    message_ids[key] = msg.id
-    save_message_ids(message_ids)
+    message_cache.forget(key)
+    state.mark_dirty(MESSAGE_ID_FILE)
+    state.mark_dirty(FINGERPRINT_FILE)
+
+outbound = OutboundQueue()
+fanout = FanoutDispatcher(client, subscriptions, outbound, send_or_edit, post_message)
+metrics.Gauge('walnut_outbound_queue_depth', 'Discord requests waiting in the outbound queue', function=lambda: outbound.depth)
+
+async def send_pages(channel, key, pages):
+    """Send or edit one message per page and remove pages left over from a longer render"""
+    deliveries = [fanout.edit(channel, embeds, page_key(key, number)) for number, embeds in enumerate(pages)]
+    number = len(pages)
+    while page_key(key, number) in message_ids:
+        deliveries.append(outbound.submit(
+            'delete', channel.id, functools.partial(delete_message, channel, page_key(key, number)),
+            coalesce_key=page_key(key, number)
+        ))
+        number += 1
+    await asyncio.gather(*deliveries)
+
+async def broadcast_pages(feed, key, pages):
+    await fanout.each(feed, lambda guild_id, channel: send_pages(channel, guild_key(guild_id, key), pages))
+item_index = ItemIndex()
+
+card_renderer = None
+if STOCK_CARDS and stock_cards.available():
+    card_renderer = stock_cards.StockCardRenderer(stock_cards.SpriteAtlas('assets'))
+    metrics.Gauge(
+        'walnut_card_cache_hit_ratio', 'Share of stock cards served from the render cache',
+        function=lambda: card_renderer.hits / max(1, card_renderer.hits + card_renderer.misses)
+    )
+
+def drop_watcher(user_id):
+    watchlist.remove_user(user_id)
+    state.mark_dirty(WATCH_FILE)
+
+direct_messages = DirectMessenger(client, on_undeliverable=drop_watcher)
+metrics.Gauge('walnut_watch_dm_queue_depth', 'Watchlist DMs waiting to be sent', function=lambda: direct_messages.depth)
 
-def build_traveling_merchant_embed(merchant_name, items):
+def watch_line(item, where):
+    label = item_label(item['item_id'], item.get('display_name', item['item_id']))
+    return f"{label} **{item.get('quantity', '-')}x** {where} until <t:{item.get('end_date_unix', 0)}:t>"
+
+def notify_watchers(lines):
+    """DM every user watching an item in lines ({item_id: line}), one message per user"""
+    for user_id, item_ids in watchlist.match(lines).items():
+        content = '\n'.join(['**Watchlist:**'] + [lines[item_id] for item_id in item_ids])
+        direct_messages.send(user_id, content=content[:2000])
+
+def build_traveling_merchant_pages(merchant_name, items):
+    """Merchant embed, followed by extra pages for any stock lines that did not fit in it"""
     embed = discord.Embed(title=f"{merchant_name}", color=0xff6600, timestamp=datetime.now(timezone.utc))
+    overflow = []
     
     if items:
         end_unix = items[0].get('end_date_unix', 0)
@@ -194,272 +420,644 @@ def build_traveling_merchant_embed(merchant_name, items):
             item_id = item.get('item_id', 'unknown')
             display_name = item.get('display_name', item.get('item_id', 'Unknown'))
             qty = item.get('quantity', '-')
-            item_emoji = get_emoji(item_id)
-            
-            lines.append(f"{item_emoji} {display_name} **{qty}x**")
+
+            lines.append(f"{item_label(item_id, display_name)} **{qty}x**")
         
         if lines:
-            stock_description = '\n'.join(lines)
-
-            embed.add_field(name="Stock", value=stock_description, inline=False)
+            overflow = add_line_fields(embed, "Stock", lines)
     
-    return embed
-
-LAST_SEEN_STOCK_FILE = 'last_seen_stock.json'
-ACTIVE_WEATHER_FILE = 'active_weather.json'
+    return [[embed]] + paginate(f"{merchant_name} (continued)", overflow, 0xff6600, timestamp=embed.timestamp)
+
+STOCK_RENDERING = {
+    'seed': ('stock', 'stock_seed', 'Seed Stock', 0x00ff99),
+    'gear': ('stock', 'stock_gear', 'Gear Stock', 0x3399ff),
+    'egg': ('stock', 'stock_egg', 'Egg Stock', 0xffcc00),
+    'eventshop': ('eventshop', 'stock_eventshop', 'Event Shop Stock', 0xff6600),
+}
+
+@stock_feed.subscribe
+async def update_stock(stock):
+    now = int(time.time())
+
+    def is_active(item):
+        start = item.get('start_date_unix', 0)
+        end = item.get('end_date_unix', 0)
+        return (start or 0) <= now < (end or 0)
+
+    active_stock = {category: [item for item in items if is_active(item)] for category, items in stock_categories(stock)}
+    for category, items in active_stock.items():
+        history.record_stock(category, items)
+
+    delta = diff_stock({category: last_seen_stock.get(category, []) for category in active_stock}, active_stock)
+    if delta:
+        for category in delta.changed_categories:
+            last_seen_stock[category] = thaw(active_stock[category])
+        state.mark_dirty(LAST_SEEN_STOCK_FILE)
+
+        for category, (feed, key, title, color) in STOCK_RENDERING.items():
+            if category in delta.changed_categories and active_stock[category]:
+                embed = build_embed(title, active_stock[category], color=color)
+                cards = None
+                if card_renderer is not None:
+                    filename = f'{key}.png'
+                    card = await asyncio.to_thread(card_renderer.render, title, active_stock[category], color)
+                    cards = [(filename, card)]
+                    embed.set_image(url=f'attachment://{filename}')
+                await fanout.broadcast(feed, key, embed, cards=cards)
+
+    # A restock with the same quantity as the last rotation is not a delta, so alerts look at every
+    # active item and rely on the per-window dedupe of the alert engine and the watchlist
+    active = [item for items in active_stock.values() for item in items]
+    if alert_engine.prune(now):
+        state.mark_dirty(ALERT_FILE)
+    if watchlist.prune(now):
+        state.mark_dirty(WATCH_NOTICE_FILE)
+    watch_lines = {
+        item['item_id']: watch_line(item, 'in stock')
+        for item in active
+        if item['item_id'] in watchlist.data and watchlist.first_notice(f"{item['item_id']}:{item.get('start_date_unix', 0)}", item.get('end_date_unix', 0))
+    }
+    if watch_lines:
+        state.mark_dirty(WATCH_NOTICE_FILE)
+        notify_watchers(watch_lines)
+
+    rare_roles = alert_engine.collect(active)
+    if rare_roles:
+        state.mark_dirty(ALERT_FILE)
+        await state.flush()
+        await fanout.post('stock', lambda channel: alert_message(channel, rare_roles))
+
+@stock_feed.subscribe
+async def update_merchant(stock):
+    merchant = thaw(stock.get('travelingmerchant_stock', {}))
+    merchant_name = merchant.get('merchantName', 'Traveling Merchant')
+    merchant_items = merchant.get('stock', [])
+    
+    now = int(time.time())
+    def is_active(item):
+        start = item.get('start_date_unix', 0)
+        end = item.get('end_date_unix', 0)
+        return (start or 0) <= now < (end or 0)
+    
+    active_merchant_items = [item for item in merchant_items if is_active(item)]
+    history.record_stock('travelingmerchant', active_merchant_items)
+    
+    merchant_start = None
+    merchant_end = None
+    if active_merchant_items:
+        merchant_start = active_merchant_items[0].get('start_date_unix')
+        merchant_end = active_merchant_items[0].get('end_date_unix')
+
+    new_merchant = False
+
+    if merchant != last_seen_stock.get('merchant', {}):
+        last_seen_stock['merchant'] = merchant
+        state.mark_dirty(LAST_SEEN_STOCK_FILE)
+
+    if active_merchant_items:
+        stock_ids = [item.get('item_id') for item in active_merchant_items]
+        active_window = [merchant_start, merchant_end]
+        last_merchant_info = last_seen_stock.get('merchant_info', {'merchantName': None, 'stock_ids': [], 'active_window': [0, 0]})
+        if (
+            merchant_name != last_merchant_info.get('merchantName') or
+            stock_ids != last_merchant_info.get('stock_ids') or
+            active_window != last_merchant_info.get('active_window')
+        ):
+            last_seen_stock['merchant_info'] = {
+                'merchantName': merchant_name,
+                'stock_ids': stock_ids,
+                'active_window': active_window
+            }
+            state.mark_dirty(LAST_SEEN_STOCK_FILE)
+            new_merchant = True
+
+    if new_merchant:
+        notify_watchers({item.get('item_id'): watch_line(item, f'at the {merchant_name}') for item in active_merchant_items})
+
+    if active_merchant_items:
+        pages = build_traveling_merchant_pages(merchant_name, active_merchant_items)
+        await broadcast_pages('merchant', 'merchant', pages)
+
+@stock_feed.subscribe
+async def index_stock(stock):
+    item_index.update_stock(stock, int(time.time()))
+
+@stock_feed.subscribe
+async def checkpoint_stock(snapshot):
+    checkpoint['stock'] = {'version': snapshot.version, 'fetched_at': snapshot.fetched_at, 'payload': thaw(snapshot.payload)}
+    state.mark_dirty(CHECKPOINT_FILE)
+
+def checkpoint_responses(*changed):
+    if any(changed):
+        checkpoint['responses'] = response_cache.export()
+        state.mark_dirty(CHECKPOINT_FILE)
+
+@stock_feed.subscribe
+async def relay_stock(snapshot):
+    await relay('stock', {'version': snapshot.version, 'fetched_at': snapshot.fetched_at, 'stock': thaw(snapshot.payload)})
+
+def next_stock_deadline(stock):
+    now = int(time.time())
+    end_times = []
+    for key in ('seed_stock', 'gear_stock', 'egg_stock', 'eventshop_stock'):
+        end_times.extend(item.get('end_date_unix', 0) for item in stock.get(key, []))
+    merchant = stock.get('travelingmerchant_stock', {})
+    end_times.extend(item.get('end_date_unix', 0) for item in merchant.get('stock', []))
+    return min((t for t in end_times if t and t > now), default=0)
+
+def rotation_arrived(stock, boundary):
+    """Whether stock holds an active item that started at or after boundary
+
+    Items ending at the boundary drop out of next_stock_deadline on their own, so a later deadline alone
+    does not mean the API has published the new rotation yet.
+    """
+    now = time.time()
+    categories = [items for _, items in stock_categories(stock)]
+    categories.append(stock.get('travelingmerchant_stock', {}).get('stock', []))
+    return any((item.get('start_date_unix') or 0) >= boundary for items in categories for item in active_items(items, now))
+
+PREFETCH_LEAD_SECONDS = 2
+BURST_INTERVAL_SECONDS = 1
+BURST_WINDOW_SECONDS = 30
+
+def observe_rotations(stock):
+    changed = False
+    for category, items in stock_categories(stock):
+        changed = rotation_tracker.observe(category, items) or changed
+    merchant = stock.get('travelingmerchant_stock', {})
+    changed = rotation_tracker.observe('travelingmerchant', merchant.get('stock', [])) or changed
+    if changed:
+        state.mark_dirty(ROTATION_FILE)
+
+async def poll_stock():
+    if stream is not None and stream.connected:
+        # The push feed delivers rotations as they happen; polling only reconciles anything it missed
+        observe_rotations(await stock_feed.refresh())
+        return time.time() + STREAM_RECONCILE_SECONDS
+
+    boundary = rotation_tracker.pending_boundary
+    if boundary and time.time() < boundary + BURST_WINDOW_SECONDS:
+        # Woken just ahead of a rotation: poll in a tight burst until the new rotation shows up
+        await asyncio.sleep(max(0, boundary - time.time()))
+        while True:
+            snapshot = await stock_feed.refresh(force=True)
+            rotated = rotation_arrived(snapshot, boundary)
+            if rotated or time.time() >= boundary + BURST_WINDOW_SECONDS:
+                break
+            await asyncio.sleep(BURST_INTERVAL_SECONDS)
+        if rotated:
+            latency = rotation_tracker.record_latency(boundary, time.time())
+            ROTATION_PUBLISH_LATENCY.observe(max(latency, 0))
+            print(f"Published stock rotation {latency:.2f}s after the boundary")
+        else:
+            print(f"Stock rotation due at {boundary} did not appear within {BURST_WINDOW_SECONDS}s")
+    else:
+        snapshot = await stock_feed.refresh()
 
-def load_json_file(filename, default):
-    """Load JSON file from data directory"""
-    data_path = os.path.join('data', filename)
-    if os.path.exists(data_path):
-        with open(data_path, 'r') as f:
-            return json.load(f)
-    return default
+    observe_rotations(snapshot)
+    now = time.time()
+    next_unix = next_stock_deadline(snapshot)
+    predicted = rotation_tracker.next_boundary(now)
+    if predicted and (not next_unix or predicted < next_unix):
+        next_unix = predicted
+    rotation_tracker.pending_boundary = next_unix
+    return max(next_unix - PREFETCH_LEAD_SECONDS, now + 1) if next_unix else None
 
-def save_json_file(filename, data):
-    """Save JSON file to data directory"""
-    data_path = os.path.join('data', filename)
-    with open(data_path, 'w') as f:
-        json.dump(data, f)
+async def update_egg_channel():
+    egg_info, egg_changed = await fetch_egg_info_api()
+    checkpoint_responses(egg_changed)
+    await relay('egg', {'egg': egg_info})
+    return await apply_egg_info(egg_info, egg_changed)
+
+async def apply_egg_info(egg_info, egg_changed):
+    warm_item_labels(egg_info)
+    if egg_changed:
+        item_index.update_catalogue('egg', egg_info)
+    if egg_info and egg_changed:
+        pages = build_info_pages('Eggs', egg_info, color=0xffcc00)
+        await broadcast_pages('egg', 'egg', pages)
+
+    valid_times = []
+    for item in egg_info:
+        last_seen = item.get('last_seen', 0)
+        if last_seen and last_seen != 0 and last_seen != '0':
+            try:
+                valid_times.append(int(last_seen))
+            except (ValueError, TypeError):
+                continue
+    return min(valid_times) if valid_times else 0
 
-last_seen_stock = load_json_file(LAST_SEEN_STOCK_FILE, {'seed': [], 'gear': [], 'merchant': {}, 'merchant_info': {'merchantName': None, 'stock_ids': [], 'active_window': [0, 0]}})
-last_seen_weather = load_json_file(ACTIVE_WEATHER_FILE, {'active_weathers': []})
+async def update_seed_gear_channels():
+    seed_info, seed_changed = await fetch_seed_info_api()
+    gear_info, gear_changed = await fetch_gear_info_api()
+    checkpoint_responses(seed_changed, gear_changed)
+    await relay('info', {'seed': seed_info, 'gear': gear_info})
+    await apply_seed_gear_info(seed_info, seed_changed, gear_info, gear_changed)
+
+async def apply_seed_gear_info(seed_info, seed_changed, gear_info, gear_changed):
+    warm_item_labels(seed_info)
+    warm_item_labels(gear_info)
+    if seed_changed:
+        item_index.update_catalogue('seed', seed_info)
+    if gear_changed:
+        item_index.update_catalogue('gear', gear_info)
+
+    if seed_info and seed_changed:
+        pages = build_info_pages('Seeds', seed_info, color=0x00ff99)
+        await broadcast_pages('seed', 'seed', pages)
+    if gear_info and gear_changed:
+        pages = build_info_pages('Gear', gear_info, color=0x3399ff)
+        await broadcast_pages('gear', 'gear', pages)
 
-async def dynamic_sleep(next_unix, fallback_seconds):
-    now = time.time()
-    if next_unix and next_unix > now:
-        sleep_for = max(1, int(next_unix - now))
-    else:
-        sleep_for = fallback_seconds
-    await asyncio.sleep(sleep_for)
+async def update_weather_channels():
+    weather_response = await fetch_weather_api()
+    weather_info, weather_info_changed = await fetch_weather_info_api()
+    checkpoint_responses(weather_info_changed)
+    await relay('weather', {'weather': weather_response, 'weather_info': weather_info})
+    await apply_weather(weather_response, weather_info, weather_info_changed)
+    if stream is not None and stream.connected:
+        return time.time() + STREAM_RECONCILE_SECONDS
+
+async def apply_weather(weather_response, weather_info, weather_info_changed):
+    weather_data = weather_response.get('weather', [])
+    if weather_info_changed:
+        item_index.update_catalogue('weather', weather_info)
+
+    active_weathers = [w for w in weather_data if w.get('active', False)]
+
+    now = int(time.time())
+    
+    current_active_weathers = []
+    for weather in last_seen_weather.get('active_weathers', []):
+        end_time = weather.get('end_duration_unix', 0)
+        if end_time > now:
+            current_active_weathers.append(weather)
+
+    current_active_weather_ids = {w.get('weather_id') for w in current_active_weathers}
+    new_active_weathers = [w for w in active_weathers if w.get('weather_id') not in current_active_weather_ids]
+    history.record_weather(new_active_weathers)
+    notify_watchers({
+        w.get('weather_id'): f"{item_label(w.get('weather_id'), w.get('weather_name', w.get('weather_id')))} weather until <t:{w.get('end_duration_unix', 0)}:t>"
+        for w in new_active_weathers
+    })
+
+    embeds = [embed for embed in (build_weather_embed([weather]) for weather in new_active_weathers) if embed]
+    if embeds:
+        await fanout.announce('weather_updates', embeds)
+
+    if active_weathers != current_active_weathers:
+        last_seen_weather['active_weathers'] = active_weathers
+        state.mark_dirty(ACTIVE_WEATHER_FILE)
+
+    if weather_info and weather_info_changed:
+        pages = build_info_pages('Weather', weather_info, color=0x00cccc, time_key='last_seen')
+        await broadcast_pages('weather', 'weather', pages)
+
+STREAM_RECONCILE_SECONDS = 900
+
+async def handle_stream_message(message):
+    """Feed a push-feed event through the same handlers the pollers use"""
+    stock_updates = {key: value for key, value in message.items() if key.endswith('_stock')}
+    if stock_updates:
+        payload = thaw(stock_feed.latest.payload) if stock_feed.latest else {}
+        payload.update(stock_updates)
+        await stock_feed.push(payload)
+    if 'weather' in message:
+        weather_response = {'weather': message['weather']}
+        weather_info = response_cache.cached_payload(API_WEATHER_INFO) or []
+        await relay('weather', {'weather': weather_response, 'weather_info': weather_info})
+        await apply_weather(weather_response, weather_info, False)
+
+def stream_state_changed(connected):
+    if not connected:
+        # Poll right away for whatever the feed would have delivered while it was down
+        scheduler.reschedule('stock', time.time())
+        scheduler.reschedule('weather', time.time())
+
+stream = StreamSource(STREAM_URL, handle_stream_message, headers=HEADERS, on_state=stream_state_changed) if STREAM_URL else None
+metrics.Gauge('walnut_stream_connected', 'Whether the push feed is connected', function=lambda: int(bool(stream and stream.connected)))
+
+async def ingest():
+    """Run the pollers, plus the push feed when STREAM_URL is set"""
+    if stream is not None:
+        stream.start()
+    await scheduler.run()
+
+def restore_checkpoint():
+    """Rebuild the stock snapshot and item catalogues from the checkpoint without calling the API"""
+    saved = checkpoint.get('stock')
+    if saved:
+        snapshot = StockSnapshot(saved['version'], saved['fetched_at'], freeze(saved['payload']))
+        stock_feed.restore(snapshot)
+        item_index.update_stock(snapshot, int(time.time()))
+    for category, url in (('egg', API_EGG_INFO), ('seed', API_SEED_INFO), ('gear', API_GEAR_INFO), ('weather', API_WEATHER_INFO)):
+        payload = response_cache.cached_payload(url)
+        if payload:
+            warm_item_labels(payload)
+            item_index.update_catalogue(category, payload)
+
+restore_checkpoint()
+
+# Info channels are not urgent: on startup let the stock poll go first, even when a saved deadline has passed
+INFO_STARTUP_DELAY_SECONDS = 60
+startup_due = dict(checkpoint['due'])
+for name in ('egg', 'info'):
+    startup_due[name] = max(startup_due.get(name) or 0, time.time() + INFO_STARTUP_DELAY_SECONDS)
+
+scheduler = Scheduler()
+scheduler.add_job('stock', poll_stock, 300, first_run=startup_due.get('stock'))
+scheduler.add_job('egg', update_egg_channel, 1800, first_run=startup_due.get('egg'))
+scheduler.add_job('info', update_seed_gear_channels, 300, first_run=startup_due.get('info'))
+scheduler.add_job('weather', update_weather_channels, 60, first_run=startup_due.get('weather'))
+
+leader_lock = LeaderLock('data/leader.lock')
+SNAPSHOT_SOCKET = 'data/snapshots.sock'
+LEADER_RETRY_SECONDS = 5
+hub = None
+received_digests = {}
+metrics.Gauge('walnut_cluster_leader', 'Whether this process polls upstream for the cluster', function=lambda: int(leader_lock.held))
+metrics.Gauge('walnut_cluster_workers', 'Worker processes connected to this leader', function=lambda: hub.workers if hub else 0)
+
+async def relay(kind, payload):
+    """Hand a fetched payload to the worker processes when this process is the cluster leader"""
+    if hub is not None:
+        await hub.publish(kind, payload)
+
+def received(name, payload):
+    digest = response_cache.content_hash(payload)
+    changed = received_digests.get(name) != digest
+    received_digests[name] = digest
+    return payload, changed
+
+async def apply_snapshot(kind, payload):
+    """Deliver a payload relayed by the leader to this process's guilds"""
+    if kind == 'stock':
+        snapshot = StockSnapshot(payload['version'], payload['fetched_at'], freeze(payload['stock']))
+        stock_feed.latest = snapshot
+        await stock_feed.publish(snapshot)
+    elif kind == 'egg':
+        await apply_egg_info(*received('egg', payload['egg']))
+    elif kind == 'info':
+        await apply_seed_gear_info(*received('seed', payload['seed']), *received('gear', payload['gear']))
+    elif kind == 'weather':
+        await apply_weather(payload['weather'], *received('weather_info', payload['weather_info']))
+
+async def run_cluster():
+    """Follow the leader's snapshots until this process can take the leader lock, then poll upstream"""
+    global hub
+    while not leader_lock.acquire():
+        if not await follow(SNAPSHOT_SOCKET, apply_snapshot):
+            await asyncio.sleep(LEADER_RETRY_SECONDS)
+    print('Holding the leader lock, polling upstream')
+    hub = SnapshotHub(SNAPSHOT_SOCKET)
+    await hub.start()
+    await ingest()
 
 @tasks.loop(count=1)
-async def update_stock():
-    while True:
-        stock = fetch_stock_api()
-        now = int(time.time())
-
-        def is_active(item):
-            start = item.get('start_date_unix', 0)
-            end = item.get('end_date_unix', 0)
-            return (start or 0) <= now < (end or 0)
-
-        seed_items = [item for item in stock.get('seed_stock', []) if is_active(item)]
-        gear_items = [item for item in stock.get('gear_stock', []) if is_active(item)]
-        egg_items = [item for item in stock.get('egg_stock', []) if is_active(item)]
-        eventshop_items = [item for item in stock.get('eventshop_stock', []) if is_active(item)]
-
-        last_seen_stock = load_json_file(
-            LAST_SEEN_STOCK_FILE,
-            {'seed': [], 'gear': [], 'egg': [], 'merchant': {}, 'eventshop': []}
-        )
-        new_stock = False
-        new_egg_stock = False
-        new_eventshop_stock = False
-
-        current_seed_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in seed_items}
-        last_seed_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in last_seen_stock.get('seed', [])}
-        if current_seed_ids != last_seed_ids:
-            new_stock = True
-            last_seen_stock['seed'] = seed_items
-
-        current_gear_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in gear_items}
-        last_gear_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in last_seen_stock.get('gear', [])}
-        if current_gear_ids != last_gear_ids:
-            new_stock = True
-            last_seen_stock['gear'] = gear_items
-
-        current_egg_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in egg_items}
-        last_egg_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in last_seen_stock.get('egg', [])}
-        if current_egg_ids != last_egg_ids:
-            new_egg_stock = True
-            last_seen_stock['egg'] = egg_items
-
-        current_eventshop_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in eventshop_items}
-        last_eventshop_ids = {item.get('item_id', '') + str(item.get('quantity', '')) for item in last_seen_stock.get('eventshop', [])}
-        if current_eventshop_ids != last_eventshop_ids:
-            new_eventshop_stock = True
-            last_seen_stock['eventshop'] = eventshop_items
-
-        if new_stock and (seed_items or gear_items):
-            save_json_file(LAST_SEEN_STOCK_FILE, last_seen_stock)
-            stock_channel = client.get_channel(STOCK_UPDATES_CHANNEL_ID)
-            if stock_channel:
-                if seed_items:
-                    embed = build_embed('Seed Stock', seed_items, color=0x00ff99)
-                    await send_or_edit(stock_channel, embed, 'stock_seed')
-                if gear_items:
-                    embed = build_embed('Gear Stock', gear_items, color=0x3399ff)
-                    await send_or_edit(stock_channel, embed, 'stock_gear')
-
-        if new_egg_stock and egg_items:
-            save_json_file(LAST_SEEN_STOCK_FILE, last_seen_stock)
-            stock_channel = client.get_channel(STOCK_UPDATES_CHANNEL_ID)
-            if stock_channel:
-                embed = build_embed('Egg Stock', egg_items, color=0xffcc00)
-                await send_or_edit(stock_channel, embed, 'stock_egg')
-
-        if new_eventshop_stock and eventshop_items:
-            save_json_file(LAST_SEEN_STOCK_FILE, last_seen_stock)
-            eventshop_channel = client.get_channel(config.EVENTSHOP_STOCK_CHANNEL_ID)
-            if eventshop_channel:
-                embed = build_embed('Event Shop Stock', eventshop_items, color=0xff6600)
-                await send_or_edit(eventshop_channel, embed, 'stock_eventshop')
-
-        next_stock_unix = min((item.get('end_date_unix', 0) for item in seed_items if item.get('end_date_unix', 0) > now), default=0)
-        next_eventshop_unix = min((item.get('end_date_unix', 0) for item in eventshop_items if item.get('end_date_unix', 0) > now), default=0)
-
-        if next_eventshop_unix and next_stock_unix:
-            sleep_until = min(next_stock_unix, next_eventshop_unix)
-        else:
-            sleep_until = next_stock_unix or next_eventshop_unix
-
-        await dynamic_sleep(sleep_until, 300)
+async def run_scheduler():
+    if SHARD_COUNT:
+        await run_cluster()
+    else:
+        await ingest()
 
-@tasks.loop(count=1)
-async def update_merchant():
-    while True:
-        stock = fetch_stock_api()
-        merchant = stock.get('travelingmerchant_stock', {})
-        merchant_name = merchant.get('merchantName', 'Traveling Merchant')
-        merchant_items = merchant.get('stock', [])
-        
-        now = int(time.time())
-        def is_active(item):
-            start = item.get('start_date_unix', 0)
-            end = item.get('end_date_unix', 0)
-            return (start or 0) <= now < (end or 0)
-        
-        active_merchant_items = [item for item in merchant_items if is_active(item)]
-        
-        merchant_start = None
-        merchant_end = None
-        if active_merchant_items:
-            merchant_start = active_merchant_items[0].get('start_date_unix')
-            merchant_end = active_merchant_items[0].get('end_date_unix')
-
-        last_seen_stock = load_json_file(LAST_SEEN_STOCK_FILE, {'seed': [], 'gear': [], 'merchant': {}, 'merchant_info': {'merchantName': None, 'stock_ids': [], 'active_window': [0, 0]}})
-        new_merchant = False
-
-        if merchant != last_seen_stock.get('merchant', {}):
-            last_seen_stock['merchant'] = merchant
-            save_json_file(LAST_SEEN_STOCK_FILE, last_seen_stock)
-
-        if active_merchant_items:
-            stock_ids = [item.get('item_id') for item in active_merchant_items]
-            active_window = [merchant_start, merchant_end]
-            last_merchant_info = last_seen_stock.get('merchant_info', {'merchantName': None, 'stock_ids': [], 'active_window': [0, 0]})
-            if (
-                merchant_name != last_merchant_info.get('merchantName') or
-                stock_ids != last_merchant_info.get('stock_ids') or
-                active_window != last_merchant_info.get('active_window')
-            ):
-                last_seen_stock['merchant_info'] = {
-                    'merchantName': merchant_name,
-                    'stock_ids': stock_ids,
-                    'active_window': active_window
-                }
-                save_json_file(LAST_SEEN_STOCK_FILE, last_seen_stock)
-                new_merchant = True
-
-        if active_merchant_items:
-            merchant_channel = client.get_channel(TRAVELING_MERCHANT_CHANNEL_ID)
-            if merchant_channel:
-                embed = build_traveling_merchant_embed(merchant_name, active_merchant_items)
-                await send_or_edit(merchant_channel, embed, 'merchant')
-
-        next_unix = min((item.get('end_date_unix', 0) for item in active_merchant_items if item.get('end_date_unix', 0) > now), default=0)
-        await dynamic_sleep(next_unix, 14400)
 
-@tasks.loop(count=1)
-async def update_egg_channel():
-    while True:
-        egg_info = fetch_egg_info_api()
-        egg_channel = client.get_channel(EGG_CHANNEL_ID)
-        if egg_channel and egg_info:
-            embed = build_info_embed('Eggs', egg_info, color=0xffcc00)
-            await send_or_edit(egg_channel, embed, 'egg')
-
-        valid_times = []
-        for item in egg_info:
-            last_seen = item.get('last_seen', 0)
-            if last_seen and last_seen != 0 and last_seen != '0':
-                try:
-                    valid_times.append(int(last_seen))
-                except (ValueError, TypeError):
-                    continue
-        next_unix = min(valid_times) if valid_times else 0
-        await dynamic_sleep(next_unix, 1800)
-
-@tasks.loop(minutes=5)
-async def update_seed_gear_channels():
-    seed_info = fetch_seed_info_api()
-    gear_info = fetch_gear_info_api()
-    seed_channel = client.get_channel(SEED_CHANNEL_ID)
-    gear_channel = client.get_channel(GEAR_CHANNEL_ID)
-    
-    if seed_channel and seed_info:
-        embed = build_info_embed('Seeds', seed_info, color=0x00ff99)
-        await send_or_edit(seed_channel, embed, 'seed')
-    if gear_channel and gear_info:
-        embed = build_info_embed('Gear', gear_info, color=0x3399ff)
-        await send_or_edit(gear_channel, embed, 'gear')
-
-@tasks.loop(minutes=1)
-async def update_weather_channels():
-    try:
-        weather_response = fetch_weather_api()
-        weather_data = weather_response.get('weather', [])
+def migrate_config_channels():
+    """Subscribe the guilds owning the config.py channels and move their unscoped message ids"""
+    for feed, channel_id in CONFIG_CHANNELS.items():
+        channel = client.get_channel(channel_id)
+        if not channel or not channel.guild:
+            continue
+        guild_id = channel.guild.id
+        if subscriptions.channel_for(guild_id, feed) is None:
+            subscriptions.subscribe(guild_id, feed, channel_id)
+            state.mark_dirty(SUBSCRIPTION_FILE)
+        for key in LEGACY_MESSAGE_KEYS.get(feed, ()):
+            if key in message_ids and guild_key(guild_id, key) not in message_ids:
+                message_ids[guild_key(guild_id, key)] = message_ids.pop(key)
+                if key in fingerprints:
+                    fingerprints[guild_key(guild_id, key)] = fingerprints.pop(key)
+                state.mark_dirty(MESSAGE_ID_FILE)
+                state.mark_dirty(FINGERPRINT_FILE)
+
+@tree.command(name='subscribe', description='Post a feed in this channel')
+@app_commands.describe(feed='Feed to post here', webhook='Post through a webhook in this channel instead of as the bot')
+@app_commands.choices(feed=[app_commands.Choice(name=feed, value=feed) for feed in FEEDS])
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.guild_only()
+async def subscribe_command(interaction: discord.Interaction, feed: str, webhook: Optional[bool] = None):
+    if webhook and webhooks.for_channel(interaction.channel_id) is None:
+        try:
+            created = await interaction.channel.create_webhook(name=client.user.name)
+        except discord.Forbidden:
+            await interaction.response.send_message('I need the Manage Webhooks permission here.', ephemeral=True)
+            return
+        webhooks.set_url(interaction.channel_id, created.url)
+        state.mark_dirty(WEBHOOK_FILE)
+    elif webhook is False and webhooks.for_channel(interaction.channel_id) is not None:
+        webhooks.remove(interaction.channel_id)
+        state.mark_dirty(WEBHOOK_FILE)
+    subscriptions.subscribe(interaction.guild_id, feed, interaction.channel_id)
+    state.mark_dirty(SUBSCRIPTION_FILE)
+    await interaction.response.send_message(f'This channel now receives **{feed}** updates.', ephemeral=True)
+
+@tree.command(name='unsubscribe', description='Stop posting a feed in this server')
+@app_commands.describe(feed='Feed to stop')
+@app_commands.choices(feed=[app_commands.Choice(name=feed, value=feed) for feed in FEEDS])
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.guild_only()
+async def unsubscribe_command(interaction: discord.Interaction, feed: str):
+    subscriptions.unsubscribe(interaction.guild_id, feed)
+    state.mark_dirty(SUBSCRIPTION_FILE)
+    await interaction.response.send_message(f'Stopped **{feed}** updates for this server.', ephemeral=True)
+
+def active_items(items, now):
+    return [item for item in items if (item.get('start_date_unix') or 0) <= now < (item.get('end_date_unix') or 0)]
+
+async def item_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=record['display_name'], value=record['item_id'])
+        for record in item_index.complete(current)
+    ]
+
+@tree.command(name='stock', description='Show the current shop stock')
+async def stock_command(interaction: discord.Interaction):
+    snapshot = stock_feed.latest
+    if snapshot is None:
+        await interaction.response.send_message('Stock has not been fetched yet.', ephemeral=True)
+        return
+
+    now = int(time.time())
+    embeds = []
+    for category, (feed, key, title, color) in STOCK_RENDERING.items():
+        items = active_items(snapshot.get(f'{category}_stock', []), now)
+        if items:
+            embeds.append(build_embed(title, items, color=color))
+    merchant = snapshot.get('travelingmerchant_stock', {})
+    merchant_items = active_items(merchant.get('stock', []), now)
+    if merchant_items:
+        embeds.extend(build_traveling_merchant_pages(merchant.get('merchantName', 'Traveling Merchant'), merchant_items)[0])
+
+    if embeds:
+        await interaction.response.send_message(embeds=embeds[:10], ephemeral=True)
+    else:
+        await interaction.response.send_message('Nothing is in stock right now.', ephemeral=True)
+
+LASTSEEN_LIMIT = 5
+RESTOCK_WINDOW_SECONDS = 7 * 24 * 3600
+
+@tree.command(name='item', description='Show what is known about an item')
+@app_commands.describe(name='Item name')
+@app_commands.autocomplete(name=item_autocomplete)
+async def item_command(interaction: discord.Interaction, name: str):
+    record = item_index.resolve(name)
+    if record is None:
+        await interaction.response.send_message(f'No item called **{name}**.', ephemeral=True)
+        return
+
+    embed = discord.Embed(title=item_label(record['item_id'], record['display_name']), color=0x8e44ad)
+    embed.add_field(name='Category', value=record['category'].capitalize())
+    last_seen = record.get('last_seen')
+    if last_seen and last_seen != '0':
+        embed.add_field(name='Last seen', value=f'<t:{last_seen}:R>')
+    in_stock = item_index.stock.get(record['item_id'])
+    if in_stock:
+        category, item = in_stock
+        end_unix = item.get('end_date_unix')
+        value = f"**{item.get('quantity', '-')}x** in {category}"
+        if end_unix:
+            value += f' until <t:{end_unix}:t>'
+        embed.add_field(name='In stock', value=value, inline=False)
+    if record['category'] != 'weather':
+        restocks = dict(await history.restock_frequency(int(time.time()) - RESTOCK_WINDOW_SECONDS))
+        embed.add_field(name='Restocks (7 days)', value=str(restocks.get(record['item_id'], 0)))
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@tree.command(name='lastseen', description='Show when an item was last in stock')
+@app_commands.describe(name='Item name')
+@app_commands.autocomplete(name=item_autocomplete)
+async def lastseen_command(interaction: discord.Interaction, name: str):
+    record = item_index.resolve(name)
+    if record is None:
+        await interaction.response.send_message(f'No item called **{name}**.', ephemeral=True)
+        return
+
+    label = item_label(record['item_id'], record['display_name'])
+    last_seen = record.get('last_seen')
+    if record['item_id'] in item_index.stock:
+        message = f'{label} is in stock right now.'
+    elif last_seen and last_seen != '0':
+        message = f'{label} was last seen <t:{last_seen}:R>.'
+    else:
+        message = f'{label} has not been seen yet.'
 
-        weather_info = fetch_weather_info_api()
-        
-        weather_updates_channel = client.get_channel(WEATHER_UPDATES_CHANNEL_ID)
-        weather_channel = client.get_channel(WEATHER_CHANNEL_ID)
+    if record['category'] == 'weather':
+        lines = [f'Active <t:{start}:f>' for start, _ in await history.last_weather(record['item_id'], LASTSEEN_LIMIT)]
+    else:
+        lines = [
+            f'**{quantity}x** in {category} <t:{start}:f>'
+            for category, quantity, start, _ in await history.last_appearances(record['item_id'], LASTSEEN_LIMIT)
+        ]
+    if lines:
+        message += '\n' + '\n'.join(lines)
+    await interaction.response.send_message(message, ephemeral=True)
+
+async def watched_autocomplete(interaction: discord.Interaction, current: str):
+    current = current.lower()
+    choices = []
+    for item_id in watchlist.items_for(interaction.user.id):
+        record = item_index.resolve(item_id)
+        name = record['display_name'] if record else item_id
+        if current in name.lower():
+            choices.append(app_commands.Choice(name=name, value=item_id))
+    return choices[:25]
+
+@tree.command(name='watch', description='Get a DM whenever an item is in stock')
+@app_commands.describe(name='Item name')
+@app_commands.autocomplete(name=item_autocomplete)
+async def watch_command(interaction: discord.Interaction, name: str):
+    record = item_index.resolve(name)
+    if record is None:
+        await interaction.response.send_message(f'No item called **{name}**.', ephemeral=True)
+        return
+
+    label = item_label(record['item_id'], record['display_name'])
+    if not watchlist.watch(interaction.user.id, record['item_id']):
+        await interaction.response.send_message(
+            f'You can watch up to {MAX_WATCHES_PER_USER} items. Use /unwatch to make room.', ephemeral=True
+        )
+        return
+    state.mark_dirty(WATCH_FILE)
+    await interaction.response.send_message(f'You will get a DM when {label} shows up.', ephemeral=True)
+
+@tree.command(name='unwatch', description='Stop DMs for an item')
+@app_commands.describe(name='Item name')
+@app_commands.autocomplete(name=watched_autocomplete)
+async def unwatch_command(interaction: discord.Interaction, name: str):
+    record = item_index.resolve(name)
+    item_id = name if name in watchlist.items_for(interaction.user.id) or record is None else record['item_id']
+    if not watchlist.unwatch(interaction.user.id, item_id):
+        await interaction.response.send_message(f'You are not watching **{name}**.', ephemeral=True)
+        return
+    state.mark_dirty(WATCH_FILE)
+    label = item_label(item_id, record['display_name']) if record and record['item_id'] == item_id else f'**{item_id}**'
+    await interaction.response.send_message(f'Stopped watching {label}.', ephemeral=True)
 
-        active_weathers = [w for w in weather_data if w.get('active', False)]
+@client.event
+async def on_guild_remove(guild):
+    subscriptions.remove_guild(guild.id)
+    state.mark_dirty(SUBSCRIPTION_FILE)
 
-        last_seen_weather = load_json_file(ACTIVE_WEATHER_FILE, {'active_weathers': []})
-        now = int(time.time())
-        
-        current_active_weathers = []
-        for weather in last_seen_weather.get('active_weathers', []):
-            end_time = weather.get('end_duration_unix', 0)
-            if end_time > now:
-                current_active_weathers.append(weather)
-
-        current_active_weather_ids = {w.get('weather_id') for w in current_active_weathers}
-        new_active_weathers = [w for w in active_weathers if w.get('weather_id') not in current_active_weather_ids]
-
-        if weather_updates_channel and new_active_weathers:
-            for weather in new_active_weathers:
-                weather_id = weather.get('weather_id', 'unknown')
-                embed = build_weather_embed([weather])
-                if embed:
-                    await weather_updates_channel.send(embed=embed)
-
-        if active_weathers != current_active_weathers:
-            last_seen_weather['active_weathers'] = active_weathers
-            save_json_file(ACTIVE_WEATHER_FILE, last_seen_weather)
-
-        if weather_channel and weather_info:
-            embed = build_info_embed('Weather', weather_info, color=0x00cccc, time_key='last_seen')
-            await send_or_edit(weather_channel, embed, 'weather')
-        
-        await asyncio.sleep(60)
-        
-    except Exception as e:
-        print(f"Error in update_weather_channels: {e}")
-        await asyncio.sleep(60)
+async def sync_commands():
+    """Sync slash commands only when their definitions changed since the last sync"""
+    digest = response_cache.content_hash([command.to_dict(tree) for command in tree.get_commands()])
+    if checkpoint.get('commands') == digest:
+        return
+    await tree.sync()
+    checkpoint['commands'] = digest
+    state.mark_dirty(CHECKPOINT_FILE)
 
+started = False
 
 @client.event
 async def on_ready():
+    # discord.py fires on_ready again after every reconnect; everything below must run once
+    global started
+    if started:
+        print(f'Reconnected as {client.user}')
+        return
+    started = True
     print(f'Logged in as {client.user}')
-    update_stock.start()
-    update_merchant.start()
-    update_egg_channel.start()
-    update_seed_gear_channels.start()
-    update_weather_channels.start()
+    migrate_config_channels()
+    await sync_commands()
+    run_scheduler.start()
+
+async def main():
+    discord.utils.setup_logging()
+    state.start()
+    direct_messages.start()
+    history.start()
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+    try:
+        async with client:
+            await client.start(DISCORD_TOKEN)
+    finally:
+        if stream is not None:
+            await stream.close()
+        await outbound.join()
+        await direct_messages.close()
+        await http_client.close()
+        checkpoint['due'] = scheduler.due_times()
+        state.mark_dirty(CHECKPOINT_FILE)
+        await state.close()
+        await history.close()
+        if hub is not None:
+            await hub.close()
+        leader_lock.release()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 if __name__ == '__main__':
-    client.run(DISCORD_TOKEN) 
+    asyncio.run(main())
+
@@ -0,0 +1,54 @@
+import discord
+
+
+def build_role_index(role_maps):
+    """Flatten the per-category role maps from config into one item_id -> role_id lookup"""
+    index = {}
+    for roles in role_maps:
+        for item_id, role_id in roles.items():
+            index[item_id] = str(role_id)
+    return index
+
+
+class AlertEngine:
+    """Resolves rare-item roles for a restock and remembers which rotation windows were already pinged"""
+
+    def __init__(self, role_index, sent):
+        self.role_index = role_index
+        self.sent = sent
+
+    def collect(self, items):
+        """Return the roles to ping for items, skipping items already pinged in the same window"""
+        roles = []
+        for item in items:
+            item_id = item.get('item_id')
+            role_id = self.role_index.get(item_id)
+            if not role_id:
+                continue
+            key = f"{item_id}:{item.get('start_date_unix', 0)}"
+            if key in self.sent:
+                continue
+            self.sent[key] = item.get('end_date_unix', 0)
+            if role_id not in roles:
+                roles.append(role_id)
+        return roles
+
+    def prune(self, now):
+        expired = [key for key, end in self.sent.items() if (end or 0) <= now]
+        for key in expired:
+            del self.sent[key]
+        return bool(expired)
+
+
+def alert_message(channel, role_ids):
+    """Build the ping for one channel, limited to roles that exist in its guild"""
+    guild = getattr(channel, 'guild', None)
+    roles = [role_id for role_id in role_ids if guild and guild.get_role(int(role_id))]
+    if not roles:
+        return None
+    return {
+        'content': ' '.join(f'<@&{role_id}>' for role_id in roles),
+        'allowed_mentions': discord.AllowedMentions(
+            everyone=False, users=False, roles=[discord.Object(int(role_id)) for role_id in roles]
+        ),
+    }
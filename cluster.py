@@ -0,0 +1,123 @@
+import asyncio
+import fcntl
+import json
+import os
+
+# Stock and info payloads run to a few hundred KiB; asyncio's default 64 KiB line limit is far too small
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+
+class LeaderLock:
+    """An exclusive lock file; the process holding it is the one that polls upstream"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Try to take the lock without blocking and return whether this process holds it"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SnapshotHub:
+    """Leader side of the snapshot channel: pushes newline-delimited JSON to every connected worker
+
+    The last message of each kind is kept and replayed to workers that connect later.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._server = None
+        self._writers = set()
+        self._last = {}
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._connected, path=self.path)
+
+    async def _connected(self, reader, writer):
+        self._writers.add(writer)
+        for line in self._last.values():
+            writer.write(line)
+        try:
+            await writer.drain()
+            # Workers never send anything; reading only tells us when they go away
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def publish(self, kind, payload):
+        line = json.dumps({'kind': kind, 'payload': payload}).encode() + b'\n'
+        self._last[kind] = line
+        for writer in list(self._writers):
+            try:
+                writer.write(line)
+                await writer.drain()
+            except ConnectionError:
+                self._writers.discard(writer)
+
+    @property
+    def workers(self):
+        return len(self._writers)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def follow(path, handle):
+    """Feed every message from the leader at path to handle(kind, payload) until the connection drops
+
+    Returns False when there was no leader to follow or its stream could not be read.
+    """
+    try:
+        reader, writer = await asyncio.open_unix_connection(path, limit=MAX_MESSAGE_SIZE)
+    except (FileNotFoundError, ConnectionError):
+        return False
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            try:
+                await handle(message['kind'], message['payload'])
+            except Exception as e:
+                print(f"Error handling {message['kind']} snapshot: {e}")
+    except ConnectionError:
+        pass
+    except ValueError as e:
+        # readline() raises ValueError for a line over the limit, json.loads for a garbled one
+        print(f"Dropping snapshot connection: {e}")
+        return False
+    finally:
+        writer.close()
+    return True
@@ -0,0 +1,95 @@
+import discord
+
+TITLE_LIMIT = 256
+DESCRIPTION_LIMIT = 4096
+FIELD_VALUE_LIMIT = 1024
+FIELDS_PER_EMBED = 25
+MESSAGE_TOTAL_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+
+
+def page_key(key, number):
+    """Message key of page number (0-based); the first page keeps the plain key"""
+    return key if number == 0 else f'{key}:{number + 1}'
+
+
+def pack_lines(lines, limit):
+    """Group lines into lists that join with newlines to at most limit characters, without splitting a line"""
+    chunk = []
+    size = 0
+    for line in lines:
+        line = line[:limit]
+        extra = len(line) + (1 if chunk else 0)
+        if chunk and size + extra > limit:
+            yield chunk
+            chunk = []
+            size = 0
+            extra = len(line)
+        chunk.append(line)
+        size += extra
+    if chunk:
+        yield chunk
+
+
+def paginate(title, lines, color, timestamp=None):
+    """Stream lines into embed descriptions, grouped into messages that respect Discord's size limits
+
+    Returns a list of pages; each page is the list of embeds for one message.
+    """
+    title = title[:TITLE_LIMIT]
+    pages = []
+    page = []
+    page_used = 0
+    embed_title = title
+    embed_lines = []
+    embed_size = 0
+
+    def finish_embed():
+        page.append(discord.Embed(
+            title=embed_title, description='\n'.join(embed_lines), color=color, timestamp=timestamp
+        ))
+        return len(embed_title or '') + embed_size
+
+    for line in lines:
+        line = line[:DESCRIPTION_LIMIT]
+        extra = len(line) + (1 if embed_lines else 0)
+        fits_embed = embed_size + extra <= DESCRIPTION_LIMIT
+        fits_message = page_used + len(embed_title or '') + embed_size + extra <= MESSAGE_TOTAL_LIMIT
+        if embed_lines and not (fits_embed and fits_message):
+            page_used += finish_embed()
+            if len(page) == EMBEDS_PER_MESSAGE or page_used + len(line) > MESSAGE_TOTAL_LIMIT:
+                pages.append(page)
+                page = []
+                page_used = 0
+            embed_title = f'{title} ({len(pages) + 1})'[:TITLE_LIMIT] if not page else None
+            embed_lines = []
+            embed_size = 0
+            extra = len(line)
+        embed_lines.append(line)
+        embed_size += extra
+
+    if embed_lines:
+        finish_embed()
+    if page:
+        pages.append(page)
+    return pages
+
+
+def add_line_fields(embed, name, lines):
+    """Add lines to embed as one or more fields of at most FIELD_VALUE_LIMIT characters
+
+    Stops at the first field that would take the embed past FIELDS_PER_EMBED or MESSAGE_TOTAL_LIMIT
+    and returns the lines that did not fit, so the caller can put them on further pages.
+    """
+    lines = list(lines)
+    used = len(embed)
+    added = 0
+    for number, chunk in enumerate(pack_lines(lines, FIELD_VALUE_LIMIT)):
+        field_name = name if number == 0 else '​'
+        value = '\n'.join(chunk)
+        used += len(field_name) + len(value)
+        if len(embed.fields) == FIELDS_PER_EMBED or used > MESSAGE_TOTAL_LIMIT:
+            break
+        embed.add_field(name=field_name, value=value, inline=False)
+        added += len(chunk)
+    return lines[added:]
@@ -0,0 +1,60 @@
+import asyncio
+
+from embed_pager import EMBEDS_PER_MESSAGE
+from subscriptions import guild_key
+
+
+class FanoutDispatcher:
+    """Delivers one rendered embed to every channel subscribed to a feed"""
+
+    def __init__(self, client, registry, outbound, send_or_edit, send):
+        self.client = client
+        self.registry = registry
+        self.outbound = outbound
+        self.send_or_edit = send_or_edit
+        self.send = send
+
+    def _targets(self, feed):
+        for guild_id, channel_id in self.registry.channels(feed):
+            channel = self.client.get_channel(int(channel_id))
+            if channel:
+                yield guild_id, channel
+
+    def edit(self, channel, embeds, key, mention=None, cards=None):
+        """Queue a send or edit of the message stored under key, replacing any edit still waiting for it"""
+        return self.outbound.submit(
+            'message', channel.id, lambda: self.send_or_edit(channel, embeds, key, mention, cards), coalesce_key=key
+        )
+
+    async def broadcast(self, feed, key, embed, mention=None, cards=None):
+        """Send or edit the message stored under key in every subscribed guild; cards are (filename, bytes) images"""
+        await asyncio.gather(*(
+            self.edit(channel, embed, guild_key(guild_id, key), mention, cards)
+            for guild_id, channel in self._targets(feed)
+        ))
+
+    async def each(self, feed, deliver):
+        """Run deliver(guild_id, channel) for every subscribed channel"""
+        results = await asyncio.gather(
+            *(deliver(guild_id, channel) for guild_id, channel in self._targets(feed)), return_exceptions=True
+        )
+        for error in results:
+            if isinstance(error, Exception):
+                print(f"Error delivering {feed}: {error}")
+
+    async def announce(self, feed, embeds):
+        """Post embeds as new messages in every subscribed guild, up to ten embeds per message"""
+        for start in range(0, len(embeds), EMBEDS_PER_MESSAGE):
+            batch = embeds[start:start + EMBEDS_PER_MESSAGE]
+            await self.post(feed, lambda channel: {'embeds': batch})
+
+    async def post(self, feed, render):
+        """Post a new message built by render(channel) in every subscribed guild; None skips the channel"""
+        deliveries = []
+        for _, channel in self._targets(feed):
+            kwargs = render(channel)
+            if kwargs:
+                deliveries.append(self.outbound.submit(
+                    'post', channel.id, lambda channel=channel, kwargs=kwargs: self.send(channel, **kwargs)
+                ))
+        await asyncio.gather(*deliveries)
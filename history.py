@@ -0,0 +1,142 @@
+import asyncio
+import pathlib
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stock_appearances (
+    category TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    quantity INTEGER,
+    start_unix INTEGER NOT NULL,
+    end_unix INTEGER,
+    observed_at INTEGER NOT NULL,
+    UNIQUE (category, item_id, start_unix)
+);
+CREATE INDEX IF NOT EXISTS stock_appearances_item_time ON stock_appearances (item_id, start_unix);
+CREATE INDEX IF NOT EXISTS stock_appearances_time ON stock_appearances (start_unix);
+
+CREATE TABLE IF NOT EXISTS weather_events (
+    weather_id TEXT NOT NULL,
+    start_unix INTEGER NOT NULL,
+    end_unix INTEGER,
+    observed_at INTEGER NOT NULL,
+    UNIQUE (weather_id, start_unix)
+);
+CREATE INDEX IF NOT EXISTS weather_events_item_time ON weather_events (weather_id, start_unix);
+'''
+
+
+class HistoryStore:
+    """Append-only SQLite log of every stock rotation, merchant visit and weather event"""
+
+    def __init__(self, path='data/history.db', flush_interval=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._stock_rows = []
+        self._weather_rows = []
+        self._lock = threading.Lock()
+        self._flush_task = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        # Queries read through their own read-only connection, so in WAL mode they never wait on a flush
+        uri = pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+        self._reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._read_lock = threading.Lock()
+
+    def record_stock(self, category, items):
+        now = int(time.time())
+        for item in items:
+            self._stock_rows.append((
+                category, item.get('item_id'), item.get('quantity'),
+                item.get('start_date_unix') or now, item.get('end_date_unix'), now
+            ))
+
+    def record_weather(self, weathers):
+        now = int(time.time())
+        for weather in weathers:
+            self._weather_rows.append((
+                weather.get('weather_id'), weather.get('start_duration_unix') or now,
+                weather.get('end_duration_unix'), now
+            ))
+
+    def _write(self, stock_rows, weather_rows):
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT INTO stock_appearances (category, item_id, quantity, start_unix, end_unix, observed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (category, item_id, start_unix) DO UPDATE SET quantity = excluded.quantity',
+                stock_rows
+            )
+            self._db.executemany(
+                'INSERT OR IGNORE INTO weather_events (weather_id, start_unix, end_unix, observed_at) '
+                'VALUES (?, ?, ?, ?)',
+                weather_rows
+            )
+
+    async def flush(self):
+        if not self._stock_rows and not self._weather_rows:
+            return
+        stock_rows, self._stock_rows = self._stock_rows, []
+        weather_rows, self._weather_rows = self._weather_rows, []
+        try:
+            await asyncio.to_thread(self._write, stock_rows, weather_rows)
+        except Exception:
+            # Put the batch back in front of anything recorded meanwhile so the next flush retries it
+            self._stock_rows[:0] = stock_rows
+            self._weather_rows[:0] = weather_rows
+            raise
+
+    def _query(self, sql, params):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    async def last_appearances(self, item_id, limit=10):
+        """Return the latest (category, quantity, start_unix, end_unix) rows for item_id"""
+        return await asyncio.to_thread(
+            self._query,
+            'SELECT category, quantity, start_unix, end_unix FROM stock_appearances '
+            'WHERE item_id = ? ORDER BY start_unix DESC LIMIT ?',
+            (item_id, limit)
+        )
+
+    async def restock_frequency(self, since_unix, category=None):
+        """Return (item_id, appearances) pairs since since_unix, most frequent first"""
+        sql = 'SELECT item_id, COUNT(*) FROM stock_appearances WHERE start_unix >= ?'
+        params = [since_unix]
+        if category:
+            sql += ' AND category = ?'
+            params.append(category)
+        sql += ' GROUP BY item_id ORDER BY COUNT(*) DESC'
+        return await asyncio.to_thread(self._query, sql, params)
+
+    async def last_weather(self, weather_id, limit=10):
+        """Return the latest (start_unix, end_unix) rows for weather_id"""
+        return await asyncio.to_thread(
+            self._query,
+            'SELECT start_unix, end_unix FROM weather_events WHERE weather_id = ? ORDER BY start_unix DESC LIMIT ?',
+            (weather_id, limit)
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error writing history: {e}")
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        self._reader.close()
+        self._db.close()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+
+REQUEST_TIMEOUT = 15
+CONNECT_TIMEOUT = 5
+MAX_CONNECTIONS = 10
+MAX_CONCURRENT_REQUESTS = 4
+KEEPALIVE_TIMEOUT = 60
+
+_session = None
+_semaphore = None
+_inflight = {}
+
+UPSTREAM_LATENCY = metrics.Histogram(
+    'walnut_upstream_request_seconds', 'Latency of upstream API requests', ('endpoint',)
+)
+UPSTREAM_RESPONSES = metrics.Counter(
+    'walnut_upstream_responses_total', 'Upstream API responses by status', ('endpoint', 'status')
+)
+
+
+def endpoint_label(url):
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+class _Observe:
+    """Records latency and status of one upstream request"""
+
+    def __init__(self, url):
+        self.endpoint = endpoint_label(url)
+        self.status = 'error'
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        UPSTREAM_LATENCY.observe(time.perf_counter() - self.start, endpoint=self.endpoint)
+        UPSTREAM_RESPONSES.inc(endpoint=self.endpoint, status=self.status)
+
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use"""
+    global _session, _semaphore
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, sock_connect=CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout, version=aiohttp.HttpVersion11)
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _session
+
+
+def _coalesce(key, factory):
+    """Share one in-flight request between concurrent callers using the same key"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+
+        def _forget(done, key=key):
+            if _inflight.get(key) is done:
+                del _inflight[key]
+
+        task.add_done_callback(_forget)
+    return asyncio.shield(task)
+
+
+async def fetch_json(url, headers=None, timeout=None):
+    return await _coalesce(('json', url), lambda: _fetch_json(url, headers, timeout))
+
+
+async def fetch_response(url, headers=None, timeout=None):
+    """Fetch url and return (status, headers, payload); payload is None for 304 Not Modified"""
+    key = ('response', url, tuple(sorted((headers or {}).items())))
+    return await _coalesce(key, lambda: _fetch_response(url, headers, timeout))
+
+
+def _request_options(headers, timeout):
+    """Only override the session timeout when the caller asks for one; timeout=None would disable it"""
+    options = {'headers': headers}
+    if timeout:
+        options['timeout'] = aiohttp.ClientTimeout(total=timeout)
+    return options
+
+
+async def _fetch_json(url, headers=None, timeout=None):
+    session = get_session()
+    async with _semaphore:
+        with _Observe(url) as observed:
+            async with session.get(url, **_request_options(headers, timeout)) as response:
+                observed.status = response.status
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+
+async def _fetch_response(url, headers=None, timeout=None):
+    session = get_session()
+    async with _semaphore:
+        with _Observe(url) as observed:
+            async with session.get(url, **_request_options(headers, timeout)) as response:
+                observed.status = response.status
+                if response.status == 304:
+                    return response.status, response.headers.copy(), None
+                response.raise_for_status()
+                return response.status, response.headers.copy(), await response.json(content_type=None)
+
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,90 @@
+from stock_delta import stock_categories
+
+
+class PrefixTrie:
+    """Maps lowercase key prefixes to the ids inserted under them"""
+
+    def __init__(self):
+        self._root = {}
+
+    def insert(self, key, value):
+        node = self._root
+        for char in key.lower():
+            node = node.setdefault(char, {})
+            node.setdefault('', []).append(value)
+
+    def search(self, prefix):
+        node = self._root
+        for char in prefix.lower():
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])
+
+
+class ItemIndex:
+    """In-memory lookup of every known item, built from the polled info and stock payloads"""
+
+    def __init__(self):
+        self.items = {}
+        self.stock = {}
+        self._catalogues = {}
+        self._trie = PrefixTrie()
+
+    def update_catalogue(self, category, items):
+        self._catalogues[category] = items
+        self._rebuild()
+
+    def _rebuild(self):
+        records = {}
+        trie = PrefixTrie()
+        for category, items in self._catalogues.items():
+            for item in items:
+                item_id = item.get('item_id')
+                if not item_id:
+                    continue
+                record = {
+                    'item_id': item_id,
+                    'display_name': item.get('display_name', item_id),
+                    'category': category,
+                    'last_seen': item.get('last_seen'),
+                }
+                records[item_id] = record
+                trie.insert(item_id, item_id)
+                trie.insert(record['display_name'], item_id)
+                for word in record['display_name'].split()[1:]:
+                    trie.insert(word, item_id)
+        self.items = records
+        self._trie = trie
+
+    def update_stock(self, stock, now):
+        """Index the items of stock whose window contains now; the API also lists past and upcoming rotations"""
+        categories = list(stock_categories(stock))
+        categories.append(('travelingmerchant', stock.get('travelingmerchant_stock', {}).get('stock', [])))
+        current = {}
+        for category, items in categories:
+            for item in items:
+                if (item.get('start_date_unix') or 0) <= now < (item.get('end_date_unix') or 0):
+                    current[item.get('item_id')] = (category, item)
+        self.stock = current
+
+    def complete(self, prefix, limit=25):
+        """Return up to limit item records whose name or id starts with prefix"""
+        if not prefix:
+            records = self.items.values()
+        else:
+            seen = dict.fromkeys(self._trie.search(prefix))
+            records = [self.items[item_id] for item_id in seen if item_id in self.items]
+        return sorted(records, key=lambda record: record['display_name'])[:limit]
+
+    def resolve(self, name):
+        """Return the item record for an item id or display name, falling back to the first prefix match"""
+        name = name.strip()
+        if name in self.items:
+            return self.items[name]
+        lowered = name.lower()
+        for record in self.items.values():
+            if record['display_name'].lower() == lowered or record['item_id'].lower() == lowered:
+                return record
+        matches = self.complete(name, limit=1)
+        return matches[0] if matches else None
@@ -0,0 +1,72 @@
+import hashlib
+import json
+
+
+def embed_fingerprint(embeds, content=None):
+    """Hash the rendered content of a message, ignoring embed timestamps"""
+    if not isinstance(embeds, list):
+        embeds = [embeds]
+    data = []
+    for embed in embeds:
+        embed_data = embed.to_dict()
+        embed_data.pop('timestamp', None)
+        data.append(embed_data)
+    payload = json.dumps({'content': content, 'embeds': data}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MessageCache:
+    """Keeps PartialMessage handles for the ids in message_ids so edits never need fetch_message"""
+
+    def __init__(self, message_ids, fingerprints):
+        self.message_ids = message_ids
+        self.fingerprints = fingerprints
+        self._handles = {}
+        self.hits = 0
+        self.misses = 0
+        self.resends = 0
+        self.skipped = 0
+
+    def get(self, channel, key):
+        handle = self._handles.get(key)
+        if handle is not None and handle.channel.id == channel.id:
+            self.hits += 1
+            return handle
+        msg_id = self.message_ids.get(key)
+        if not msg_id:
+            return None
+        self.misses += 1
+        handle = channel.get_partial_message(int(msg_id))
+        self._handles[key] = handle
+        return handle
+
+    def is_current(self, key, fingerprint):
+        if key in self.message_ids and self.fingerprints.get(key) == fingerprint:
+            self.skipped += 1
+            return True
+        return False
+
+    def put(self, key, message, fingerprint=None):
+        self._handles[key] = message
+        self.message_ids[key] = message.id
+        if fingerprint is not None:
+            self.fingerprints[key] = fingerprint
+
+    def record(self, key, message_id, fingerprint=None):
+        """Store a message id that was not posted through a channel handle, such as a webhook message"""
+        self._handles.pop(key, None)
+        self.message_ids[key] = message_id
+        if fingerprint is not None:
+            self.fingerprints[key] = fingerprint
+
+    def forget(self, key):
+        self._handles.pop(key, None)
+        self.message_ids.pop(key, None)
+        self.fingerprints.pop(key, None)
+
+    def invalidate(self, key):
+        self.forget(key)
+        self.resends += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'resends': self.resends, 'skipped': self.skipped}
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import time
+
+import metrics
+
+QUEUE_WAIT = metrics.Histogram(
+    'walnut_outbound_wait_seconds', 'Time a Discord request waited in the outbound queue', ('route',)
+)
+QUEUE_COALESCED = metrics.Counter(
+    'walnut_outbound_coalesced_total', 'Queued requests replaced by a newer one for the same message', ('route',)
+)
+QUEUE_PAUSES = metrics.Counter(
+    'walnut_outbound_rate_limit_pauses_total', 'Times a bucket was paused for a rate limit', ('route',)
+)
+
+
+class _Job:
+    __slots__ = ('func', 'future', 'queued_at', 'coalesce_key')
+
+    def __init__(self, func, future, coalesce_key):
+        self.func = func
+        self.future = future
+        self.queued_at = time.perf_counter()
+        self.coalesce_key = coalesce_key
+
+
+class OutboundQueue:
+    """Runs Discord requests through one FIFO per (route, channel) bucket
+
+    Buckets drain in parallel, so a rate limit on one channel or route only holds back
+    that bucket. A request submitted with the same coalesce key as one still waiting in
+    its bucket replaces it, and both callers get the result of the newest request.
+    """
+
+    def __init__(self, max_parallel=10, attempts=3):
+        self.attempts = attempts
+        self._semaphore = asyncio.Semaphore(max_parallel)
+        self._buckets = {}
+        self._pending = {}
+        self._workers = {}
+
+    @property
+    def depth(self):
+        return sum(len(jobs) for jobs in self._buckets.values())
+
+    def submit(self, route, channel_id, func, coalesce_key=None):
+        """Queue func() on the (route, channel_id) bucket and return a future for its result"""
+        bucket = (route, channel_id)
+        if coalesce_key is not None:
+            job = self._pending.get((bucket, coalesce_key))
+            if job is not None:
+                job.func = func
+                QUEUE_COALESCED.inc(route=route)
+                return job.future
+
+        job = _Job(func, asyncio.get_running_loop().create_future(), coalesce_key)
+        self._buckets.setdefault(bucket, collections.deque()).append(job)
+        if coalesce_key is not None:
+            self._pending[(bucket, coalesce_key)] = job
+        worker = self._workers.get(bucket)
+        if worker is None or worker.done():
+            self._workers[bucket] = asyncio.create_task(self._drain(bucket))
+        return job.future
+
+    async def _drain(self, bucket):
+        route, channel_id = bucket
+        jobs = self._buckets[bucket]
+        while jobs:
+            job = jobs.popleft()
+            if job.coalesce_key is not None:
+                self._pending.pop((bucket, job.coalesce_key), None)
+            QUEUE_WAIT.observe(time.perf_counter() - job.queued_at, route=route)
+            result = None
+            for attempt in range(self.attempts):
+                try:
+                    async with self._semaphore:
+                        result = await job.func()
+                    break
+                except Exception as e:
+                    retry_after = getattr(e, 'retry_after', None)
+                    if retry_after is None or attempt == self.attempts - 1:
+                        print(f"Error delivering {route} to channel {channel_id}: {e}")
+                        break
+                    # Only this bucket waits out the rate limit; the others keep draining
+                    QUEUE_PAUSES.inc(route=route)
+                    await asyncio.sleep(retry_after)
+            if not job.future.done():
+                job.future.set_result(result)
+        del self._buckets[bucket]
+        del self._workers[bucket]
+
+    async def join(self):
+        """Wait until every queued request has been delivered"""
+        while self._workers:
+            await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
@@ -0,0 +1,329 @@
+"""Record API payloads and replay them through the bot offline.
+
+    python replay.py record --dir recordings --count 10 --interval 60
+    python replay.py replay --dir recordings
+    python replay.py bench --dir recordings --rounds 20
+    python replay.py bench --synthetic 50
+    python replay.py serve --synthetic 10 --port 8765 --interval 5
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+INFO_TYPES = ('seed', 'gear', 'egg', 'weather')
+
+
+def load_recordings(directory):
+    recordings = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path, 'r') as f:
+            recordings.append(json.load(f))
+    return recordings
+
+
+def synthetic_recordings(count, period=300):
+    """Build count fake snapshots, one per stock rotation, from the icons under assets/"""
+    names = {
+        category: sorted(os.path.splitext(os.path.basename(path))[0]
+                         for path in glob.glob(os.path.join(REPO_DIR, 'assets', category, '*.png')))
+        for category in INFO_TYPES
+    }
+    rng = random.Random(0)
+    start = int(time.time()) // period * period
+    recordings = []
+    for number in range(count):
+        now = start + number * period
+
+        def stock(category, size):
+            return [
+                {'item_id': item_id, 'display_name': item_id.replace('_', ' ').title(),
+                 'quantity': rng.randint(1, 20), 'start_date_unix': now, 'end_date_unix': now + period}
+                for item_id in rng.sample(names[category], min(size, len(names[category])))
+            ]
+
+        weather = [
+            {'weather_id': weather_id, 'weather_name': weather_id.title(), 'active': True,
+             'start_duration_unix': now, 'end_duration_unix': now + 120}
+            for weather_id in rng.sample(names['weather'], 2)
+        ]
+        recordings.append({
+            'captured_at': now + 1,
+            'stock': {
+                'seed_stock': stock('seed', 10),
+                'gear_stock': stock('gear', 8),
+                'egg_stock': stock('egg', 3),
+                'travelingmerchant_stock': {'merchantName': 'Traveling Merchant', 'stock': stock('seed', 4)},
+            },
+            'weather': {'weather': weather},
+            'info': {
+                category: [
+                    {'item_id': item_id, 'display_name': item_id.replace('_', ' ').title(),
+                     'last_seen': str(now - rng.randint(0, 86400))}
+                    for item_id in names[category]
+                ]
+                for category in INFO_TYPES
+            },
+        })
+    return recordings
+
+
+async def record(directory, count, interval):
+    import GrowWalnut as bot
+    import http_client
+
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for number in range(count):
+            captured_at = int(time.time())
+            stock, weather, *info = await asyncio.gather(
+                http_client.fetch_json(bot.API_STOCK, headers=bot.HEADERS),
+                http_client.fetch_json(bot.API_WEATHER, headers=bot.HEADERS),
+                *(http_client.fetch_json(f'https://api.joshlei.com/v2/growagarden/info?type={category}',
+                                         headers=bot.HEADERS) for category in INFO_TYPES)
+            )
+            recording = {'captured_at': captured_at, 'stock': stock, 'weather': weather,
+                         'info': dict(zip(INFO_TYPES, info))}
+            path = os.path.join(directory, f'{captured_at}.json')
+            with open(path, 'w') as f:
+                json.dump(recording, f)
+            print(f'Recorded {path}')
+            if number < count - 1:
+                await asyncio.sleep(interval)
+    finally:
+        await http_client.close()
+
+
+class FakeClock:
+    """Stands in for the time module inside GrowWalnut so replays run at recording time"""
+
+    def __init__(self):
+        self.now = time.time()
+
+    def time(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel, content=None, embeds=None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = embeds or []
+
+    async def edit(self, content=None, embeds=None, **kwargs):
+        self.channel.edits += 1
+        self.content = content
+        self.embeds = embeds or []
+        return self
+
+    async def delete(self):
+        self.channel.messages.pop(self.id, None)
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild=None):
+        self.id = channel_id
+        self.guild = guild
+        self.messages = {}
+        self.sends = 0
+        self.edits = 0
+
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        self.sends += 1
+        message = FakeMessage(self, content, embeds or ([embed] if embed else []))
+        self.messages[message.id] = message
+        return message
+
+    def get_partial_message(self, message_id):
+        return self.messages.get(message_id) or FakeMessage(self)
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+    def get_role(self, role_id):
+        return role_id
+
+
+class FakeClient:
+    def __init__(self):
+        self.channels = {}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+
+def load_bot():
+    """Import GrowWalnut inside a scratch directory wired to a fake clock and Discord client"""
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(tempfile.mkdtemp(prefix='walnut-replay-'))
+    import GrowWalnut as bot
+
+    clock = FakeClock()
+    bot.time = clock
+    client = FakeClient()
+    guild = FakeGuild(1)
+    for number, feed in enumerate(bot.FEEDS, start=1):
+        client.channels[number] = FakeChannel(number, guild)
+        bot.subscriptions.subscribe(guild.id, feed, number)
+    bot.fanout.client = client
+    return bot, clock, client
+
+
+def install_recording(bot, recording, previous):
+    """Point the bot's fetchers at one recording"""
+    def info_fetcher(category):
+        async def fetch():
+            payload = recording['info'].get(category, [])
+            return payload, payload != (previous or {}).get('info', {}).get(category)
+        return fetch
+
+    async def fetch_weather():
+        return recording['weather']
+
+    bot.fetch_egg_info_api = info_fetcher('egg')
+    bot.fetch_seed_info_api = info_fetcher('seed')
+    bot.fetch_gear_info_api = info_fetcher('gear')
+    bot.fetch_weather_info_api = info_fetcher('weather')
+    bot.fetch_weather_api = fetch_weather
+
+
+async def replay_one(bot, clock, recording, previous, version):
+    from stock_feed import StockSnapshot, freeze
+
+    clock.now = recording['captured_at']
+    install_recording(bot, recording, previous)
+    snapshot = StockSnapshot(version, clock.now, freeze(recording['stock']))
+    await bot.stock_feed.publish(snapshot)
+    await bot.update_egg_channel()
+    await bot.update_seed_gear_channels()
+    await bot.update_weather_channels()
+
+
+async def replay(recordings):
+    bot, clock, client = load_bot()
+    previous = None
+    for version, recording in enumerate(recordings, start=1):
+        await replay_one(bot, clock, recording, previous, version)
+        previous = recording
+    for channel in client.channels.values():
+        print(f'channel {channel.id}: {channel.sends} sends, {channel.edits} edits')
+    print(f'message cache: {bot.message_cache.stats()}')
+    await bot.history.close()
+
+
+def time_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+async def bench(recordings, rounds):
+    bot, clock, client = load_bot()
+    start = time.perf_counter()
+    previous = None
+    version = 0
+    for _ in range(rounds):
+        for recording in recordings:
+            version += 1
+            await replay_one(bot, clock, recording, previous, version)
+            previous = recording
+    elapsed = time.perf_counter() - start
+    print(f'end-to-end: {version} snapshots in {elapsed:.3f}s ({version / elapsed:.1f} snapshots/sec)')
+
+    recording = recordings[-1]
+    stock = recording['stock']
+    seed_items = stock.get('seed_stock', [])
+    merchant = stock.get('travelingmerchant_stock', {})
+    weather = recording['weather'].get('weather', [])
+    builders = {
+        'build_embed': lambda: bot.build_embed('Seed Stock', seed_items),
+        'build_info_pages': lambda: bot.build_info_pages('Seeds', recording['info'].get('seed', [])),
+        'build_weather_embed': lambda: bot.build_weather_embed(weather[:1]),
+        'build_traveling_merchant_pages': lambda: bot.build_traveling_merchant_pages(
+            merchant.get('merchantName', 'Traveling Merchant'), merchant.get('stock', [])
+        ),
+    }
+    if bot.card_renderer is not None:
+        builders['render_card (uncached)'] = lambda: bot.card_renderer._draw('Seed Stock', seed_items, 0x00ff99)
+    for name, builder in builders.items():
+        print(f'{name}: {time_call(builder, 200) * 1e6:.1f} us')
+    await bot.history.close()
+
+
+def stream_message(recording):
+    """Shape one recording like a push-feed event: the stock entries plus the weather list"""
+    return {**recording['stock'], 'weather': recording['weather'].get('weather', [])}
+
+
+async def serve(recordings, host, port, interval):
+    """Stand-in push feed: every WebSocket client on /ws gets the recordings in a loop"""
+    from aiohttp import web
+
+    async def handle(request):
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        try:
+            for recording in itertools.cycle(recordings):
+                await ws.send_json(stream_message(recording))
+                await asyncio.sleep(interval)
+        except ConnectionError:
+            pass
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f'Serving {len(recordings)} recordings on ws://{host}:{port}/ws')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('record', 'replay', 'bench', 'serve'))
+    parser.add_argument('--dir', default='recordings')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--interval', type=float, default=60)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--synthetic', type=int, default=0, help='replay N generated snapshots instead of --dir')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        asyncio.run(record(args.dir, args.count, args.interval))
+        return
+
+    recordings = synthetic_recordings(args.synthetic) if args.synthetic else load_recordings(os.path.abspath(args.dir))
+    if not recordings:
+        sys.exit(f'No recordings found in {args.dir}')
+    if args.command == 'replay':
+        asyncio.run(replay(recordings))
+    elif args.command == 'serve':
+        asyncio.run(serve(recordings, args.host, args.port, args.interval))
+    else:
+        asyncio.run(bench(recordings, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures and probes it again after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60, max_reset_timeout=600):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._timeout = reset_timeout
+        self._probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.time() - self.opened_at >= self._timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """Whether a call may go out; once the cool-down ends only one probe is let through at a time"""
+        state = self.state
+        if state == 'half_open':
+            if self._probing:
+                return False
+            self._probing = True
+        return state != 'open'
+
+    def release(self):
+        """Mark the call let through by allow() as finished"""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._timeout = self.reset_timeout
+
+    def record_failure(self):
+        if self.state == 'half_open':
+            # The probe failed: stay open for longer before trying again
+            self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+            self.opened_at = time.time()
+            return
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.time()
+            print(f"Circuit opened after {self.failures} failures, retrying in {self._timeout}s")
+
+
+def is_client_error(error):
+    """A 4xx other than 429 means the request was wrong, not that the upstream is unhealthy"""
+    return isinstance(error, aiohttp.ClientResponseError) and 400 <= error.status < 500 and error.status != 429
+
+
+def is_retryable(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ValueError))
+
+
+class Endpoint:
+    """Calls one upstream endpoint with retries and backoff, serving the last good payload on failure"""
+
+    def __init__(self, name, breaker, attempts=3, base_delay=1, max_delay=20, stale=None):
+        self.name = name
+        self.breaker = breaker
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stale = stale
+        self.last_good = None
+        self.last_success = None
+
+    def _serve_stale(self, error):
+        if self.last_good is None:
+            raise error
+        print(f"Serving cached {self.name} payload: {error}")
+        return self.stale(self.last_good) if self.stale else self.last_good
+
+    async def call(self, fetch):
+        if not self.breaker.allow():
+            return self._serve_stale(CircuitOpenError(f'{self.name}: upstream circuit is open'))
+        try:
+            return await self._call(fetch)
+        finally:
+            self.breaker.release()
+
+    async def _call(self, fetch):
+        for attempt in range(self.attempts):
+            try:
+                result = await fetch()
+            except Exception as e:
+                if is_client_error(e):
+                    return self._serve_stale(e)
+                # A half-open probe gets a single attempt, and an open circuit means another call just failed
+                if not is_retryable(e) or attempt == self.attempts - 1 or self.breaker.state != 'closed':
+                    self.breaker.record_failure()
+                    return self._serve_stale(e)
+                # Full jitter keeps clients from retrying in lockstep
+                await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            else:
+                self.breaker.record_success()
+                self.last_good = result
+                self.last_success = time.time()
+                return result
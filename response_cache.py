@@ -0,0 +1,69 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+
+import http_client
+import metrics
+
+
+@dataclass
+class CachedResponse:
+    digest: str
+    payload: object
+    etag: str = None
+    last_modified: str = None
+
+
+_cache = {}
+
+CACHE_RESULTS = metrics.Counter(
+    'walnut_response_cache_total', 'Info endpoint fetches by cache outcome', ('endpoint', 'result')
+)
+
+
+def content_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+async def fetch_if_changed(url, headers=None):
+    """Fetch a JSON endpoint with conditional headers and return (payload, changed)"""
+    entry = _cache.get(url)
+    request_headers = dict(headers or {})
+    if entry:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    status, response_headers, payload = await http_client.fetch_response(url, headers=request_headers)
+    endpoint = http_client.endpoint_label(url)
+    if status == 304 and entry:
+        CACHE_RESULTS.inc(endpoint=endpoint, result='not_modified')
+        return entry.payload, False
+
+    digest = content_hash(payload)
+    changed = entry is None or entry.digest != digest
+    CACHE_RESULTS.inc(endpoint=endpoint, result='changed' if changed else 'unchanged')
+    _cache[url] = CachedResponse(
+        digest=digest,
+        payload=payload,
+        etag=response_headers.get('ETag'),
+        last_modified=response_headers.get('Last-Modified'),
+    )
+    return payload, changed
+
+
+def export():
+    """Return the cached responses as plain data for a restart checkpoint"""
+    return {url: asdict(entry) for url, entry in _cache.items()}
+
+
+def restore(data):
+    """Load responses saved by export() so the first fetch after a restart can be conditional"""
+    for url, entry in data.items():
+        _cache[url] = CachedResponse(**entry)
+
+
+def cached_payload(url):
+    entry = _cache.get(url)
+    return entry.payload if entry else None
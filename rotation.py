@@ -0,0 +1,52 @@
+import math
+import statistics
+
+MAX_SAMPLES = 20
+
+
+class RotationTracker:
+    """Learns the rotation period of each stock category from observed start/end pairs"""
+
+    def __init__(self, data):
+        self.data = data
+        self.pending_boundary = None
+        self.publish_latency = []
+
+    def observe(self, category, items):
+        windows = [(item.get('start_date_unix'), item.get('end_date_unix')) for item in items]
+        windows = [(start, end) for start, end in windows if start and end and end > start]
+        if not windows:
+            return False
+        start, end = min(windows, key=lambda window: window[1])
+        entry = self.data.setdefault(category, {'periods': [], 'last_start': 0, 'last_end': 0})
+        if start == entry['last_start']:
+            return False
+        entry['periods'] = (entry['periods'] + [end - start])[-MAX_SAMPLES:]
+        entry['last_start'] = start
+        entry['last_end'] = end
+        return True
+
+    def period(self, category):
+        periods = self.data.get(category, {}).get('periods')
+        return statistics.median(periods) if periods else None
+
+    def predict(self, category, now):
+        """Return the next rotation boundary after now for category, extrapolating past the last seen end"""
+        entry = self.data.get(category)
+        if not entry or not entry['last_end']:
+            return None
+        if entry['last_end'] > now:
+            return entry['last_end']
+        period = self.period(category)
+        if not period:
+            return None
+        return entry['last_end'] + math.ceil((now - entry['last_end']) / period) * period
+
+    def next_boundary(self, now):
+        predictions = [self.predict(category, now) for category in self.data]
+        return min((p for p in predictions if p and p > now), default=None)
+
+    def record_latency(self, boundary, published_at):
+        latency = published_at - boundary
+        self.publish_latency = (self.publish_latency + [latency])[-MAX_SAMPLES:]
+        return latency
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+import metrics
+
+LATE_WARNING_SECONDS = 5
+
+JOB_DURATION = metrics.Histogram('walnut_job_duration_seconds', 'Duration of each scheduled job run', ('job',))
+JOB_LATENESS = metrics.Histogram(
+    'walnut_job_lateness_seconds', 'How late each job started relative to its deadline', ('job',)
+)
+JOB_ERRORS = metrics.Counter('walnut_job_errors_total', 'Scheduled job runs that raised', ('job',))
+
+
+class Scheduler:
+    """Runs every feed job at its own deadline from a single priority queue"""
+
+    def __init__(self, jitter=0.5):
+        self.jitter = jitter
+        self.lateness = {}
+        self._jobs = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running = set()
+
+    def add_job(self, name, func, fallback_seconds, first_run=None):
+        """Register func, which returns the unix time it next wants to run or None for the fallback interval"""
+        self._jobs[name] = (func, fallback_seconds)
+        self.schedule(name, first_run if first_run is not None else time.time())
+
+    def schedule(self, name, due):
+        heapq.heappush(self._queue, (due, next(self._counter), name))
+        self._wakeup.set()
+
+    def reschedule(self, name, due):
+        """Move name's next run to due; a job that is running now keeps the deadline it returns"""
+        if self.next_due(name) is None:
+            return
+        self._queue = [entry for entry in self._queue if entry[2] != name]
+        heapq.heapify(self._queue)
+        self.schedule(name, due)
+
+    def next_due(self, name):
+        return min((due for due, _, job in self._queue if job == name), default=None)
+
+    def due_times(self):
+        """Return {job: next deadline} for every queued job, for checkpointing across restarts"""
+        due_times = {}
+        for due, _, name in self._queue:
+            due_times[name] = min(due, due_times.get(name, due))
+        return due_times
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._queue:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._queue[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay + random.uniform(0, self.jitter))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            while self._queue and self._queue[0][0] <= now:
+                due, _, name = heapq.heappop(self._queue)
+                task = asyncio.create_task(self._run_job(name, due))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _run_job(self, name, due):
+        func, fallback_seconds = self._jobs[name]
+        lateness = time.time() - due
+        self.lateness[name] = lateness
+        JOB_LATENESS.observe(max(lateness, 0), job=name)
+        if lateness > LATE_WARNING_SECONDS:
+            print(f"Job {name} started {lateness:.1f}s late")
+
+        next_unix = None
+        try:
+            with JOB_DURATION.time(job=name):
+                next_unix = await func()
+        except Exception as e:
+            JOB_ERRORS.inc(job=name)
+            print(f"Error in {name}: {e}")
+
+        now = time.time()
+        if not next_unix or next_unix <= now:
+            next_unix = now + fallback_seconds
+        self.schedule(name, next_unix)
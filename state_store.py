@@ -0,0 +1,98 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import metrics
+
+FLUSH_DURATION = metrics.Histogram('walnut_state_flush_seconds', 'Time spent writing dirty state files')
+
+
+def atomic_write(path, data):
+    """Write bytes to path through a temp file and rename so readers never see a partial file"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StateStore:
+    """Keeps the JSON state files in memory and writes dirty ones back in the background"""
+
+    def __init__(self, root='data', flush_interval=5):
+        self.root = root
+        self.flush_interval = flush_interval
+        self._documents = {}
+        self._dirty = set()
+        self._flush_task = None
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def load(self, name, default):
+        """Return the document for name, reading it from disk the first time it is requested"""
+        if name not in self._documents:
+            data = default
+            if os.path.exists(self.path(name)):
+                with open(self.path(name), 'r') as f:
+                    data = json.load(f)
+                if isinstance(default, dict) and isinstance(data, dict):
+                    data = {**default, **data}
+            self._documents[name] = data
+        return self._documents[name]
+
+    def mark_dirty(self, name):
+        self._dirty.add(name)
+
+    def _take_dirty(self):
+        pending = {name: json.dumps(self._documents[name]).encode() for name in self._dirty}
+        self._dirty.clear()
+        return pending
+
+    def _write(self, pending):
+        for name, data in pending.items():
+            atomic_write(self.path(name), data)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        pending = self._take_dirty()
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, pending)
+            FLUSH_DURATION.observe(time.perf_counter() - start)
+        except Exception:
+            self._dirty.update(pending)
+            raise
+
+    def flush_sync(self):
+        if self._dirty:
+            self._write(self._take_dirty())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing state: {e}")
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush_sync()
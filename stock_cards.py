@@ -0,0 +1,147 @@
+import collections
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import time
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+import metrics
+
+ICON_SIZE = 48
+TILE_WIDTH = 220
+TILE_HEIGHT = 64
+COLUMNS = 3
+PADDING = 12
+HEADER_HEIGHT = 40
+BACKGROUND = (43, 45, 49, 255)
+TILE_BACKGROUND = (54, 57, 63, 255)
+TEXT_COLOR = (242, 243, 245, 255)
+MUTED_COLOR = (181, 186, 193, 255)
+
+CARD_RENDER_SECONDS = metrics.Histogram('walnut_card_render_seconds', 'Time spent rendering and encoding a stock card')
+CARD_CACHE = metrics.Counter('walnut_card_cache_total', 'Stock card lookups by cache outcome', ('result',))
+
+
+def available():
+    return Image is not None
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+class SpriteAtlas:
+    """Every icon under assets/ resized once and packed into a single in-memory image"""
+
+    def __init__(self, root='assets', size=ICON_SIZE):
+        self.size = size
+        self.boxes = {}
+        paths = sorted(glob.glob(os.path.join(root, '*', '*.png')))
+        columns = max(1, math.ceil(math.sqrt(len(paths))))
+        rows = max(1, math.ceil(len(paths) / columns))
+        self.image = Image.new('RGBA', (columns * size, rows * size), (0, 0, 0, 0))
+        for number, path in enumerate(paths):
+            item_id = os.path.splitext(os.path.basename(path))[0]
+            try:
+                with Image.open(path) as icon:
+                    icon = icon.convert('RGBA')
+                    icon.thumbnail((size, size))
+            except OSError as e:
+                print(f"Skipping icon {path}: {e}")
+                continue
+            x = number % columns * size + (size - icon.width) // 2
+            y = number // columns * size + (size - icon.height) // 2
+            self.image.paste(icon, (x, y))
+            self.boxes.setdefault(item_id, (number % columns * size, number // columns * size))
+
+    def sprite(self, item_id):
+        box = self.boxes.get(item_id)
+        if box is None:
+            return None
+        x, y = box
+        return self.image.crop((x, y, x + self.size, y + self.size))
+
+
+def card_key(title, color, items):
+    rows = [(item.get('item_id'), item.get('display_name'), item.get('quantity')) for item in items]
+    payload = json.dumps([title, color, rows], separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class StockCardRenderer:
+    """Renders a stock grid as a PNG, caching encoded cards by the content they show"""
+
+    def __init__(self, atlas, cache_size=32):
+        self.atlas = atlas
+        self.cache_size = cache_size
+        self._cards = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._title_font = _font(20)
+        self._name_font = _font(15)
+
+    def render(self, title, items, color):
+        """Return the PNG bytes of the card for items, rendering it only on a cache miss"""
+        key = card_key(title, color, items)
+        card = self._cards.get(key)
+        if card is not None:
+            self._cards.move_to_end(key)
+            self.hits += 1
+            CARD_CACHE.inc(result='hit')
+            return card
+
+        self.misses += 1
+        CARD_CACHE.inc(result='miss')
+        start = time.perf_counter()
+        card = self._draw(title, items, color)
+        CARD_RENDER_SECONDS.observe(time.perf_counter() - start)
+        self._cards[key] = card
+        if len(self._cards) > self.cache_size:
+            self._cards.popitem(last=False)
+        return card
+
+    def _fit(self, draw, text, width):
+        if draw.textlength(text, font=self._name_font) <= width:
+            return text
+        while text and draw.textlength(text + '...', font=self._name_font) > width:
+            text = text[:-1]
+        return text + '...'
+
+    def _draw(self, title, items, color):
+        rows = max(1, math.ceil(len(items) / COLUMNS))
+        width = PADDING + COLUMNS * (TILE_WIDTH + PADDING)
+        height = HEADER_HEIGHT + PADDING + rows * (TILE_HEIGHT + PADDING)
+        image = Image.new('RGBA', (width, height), BACKGROUND)
+        draw = ImageDraw.Draw(image)
+        rgb = ((color >> 16) & 0xff, (color >> 8) & 0xff, color & 0xff, 255)
+        draw.rectangle((0, 0, width, 4), fill=rgb)
+        draw.text((PADDING, 12), title, font=self._title_font, fill=TEXT_COLOR)
+
+        for number, item in enumerate(items):
+            x = PADDING + number % COLUMNS * (TILE_WIDTH + PADDING)
+            y = HEADER_HEIGHT + PADDING + number // COLUMNS * (TILE_HEIGHT + PADDING)
+            draw.rounded_rectangle((x, y, x + TILE_WIDTH, y + TILE_HEIGHT), radius=8, fill=TILE_BACKGROUND)
+            item_id = item.get('item_id', 'unknown')
+            icon_y = y + (TILE_HEIGHT - self.atlas.size) // 2
+            sprite = self.atlas.sprite(item_id)
+            if sprite is not None:
+                image.alpha_composite(sprite, (x + 8, icon_y))
+            name = self._fit(draw, item.get('display_name', item_id), TILE_WIDTH - self.atlas.size - 24)
+            text_x = x + self.atlas.size + 16
+            draw.text((text_x, y + 14), name, font=self._name_font, fill=TEXT_COLOR)
+            draw.text((text_x, y + 36), f"{item.get('quantity', '-')}x", font=self._name_font, fill=MUTED_COLOR)
+
+        output = io.BytesIO()
+        image.save(output, format='PNG', optimize=False)
+        return output.getvalue()
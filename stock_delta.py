@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+
+ADDED = 'added'
+REMOVED = 'removed'
+QUANTITY_CHANGED = 'quantity_changed'
+
+
+@dataclass(frozen=True)
+class StockEvent:
+    kind: str
+    category: str
+    item_id: str
+    quantity: object = None
+    previous_quantity: object = None
+    item: object = None
+
+
+@dataclass(frozen=True)
+class StockDelta:
+    events: tuple
+    changed_categories: frozenset
+
+    def __bool__(self):
+        return bool(self.changed_categories)
+
+    def for_category(self, category):
+        return [event for event in self.events if event.category == category]
+
+    def items(self, *kinds):
+        """Return the current item of every event whose kind is in kinds"""
+        return [event.item for event in self.events if event.kind in kinds and event.item is not None]
+
+
+def stock_categories(stock):
+    """Yield (category, items) for every list-valued *_stock entry of a /stock payload"""
+    for key, value in stock.items():
+        if key.endswith('_stock') and isinstance(value, (list, tuple)):
+            yield key[:-len('_stock')], value
+
+
+def _index(items):
+    return {(item.get('item_id'), item.get('quantity')): item for item in items}
+
+
+def diff_items(category, previous, current):
+    """Return the events turning previous into current for one category"""
+    previous_keys = _index(previous)
+    current_keys = _index(current)
+    if previous_keys.keys() == current_keys.keys():
+        return []
+
+    previous_quantities = {item_id: quantity for item_id, quantity in previous_keys}
+    events = []
+    seen = set()
+    for (item_id, quantity), item in current_keys.items():
+        seen.add(item_id)
+        if item_id not in previous_quantities:
+            events.append(StockEvent(ADDED, category, item_id, quantity, item=item))
+        elif previous_quantities[item_id] != quantity:
+            events.append(StockEvent(
+                QUANTITY_CHANGED, category, item_id, quantity, previous_quantities[item_id], item=item
+            ))
+    for (item_id, quantity), item in previous_keys.items():
+        if item_id not in seen:
+            events.append(StockEvent(REMOVED, category, item_id, previous_quantity=quantity, item=item))
+    return events
+
+
+def diff_stock(previous, current):
+    """Compare {category: items} mappings and return a StockDelta covering every category in either"""
+    events = []
+    changed = set()
+    for category in set(previous) | set(current):
+        category_events = diff_items(category, previous.get(category, []), current.get(category, []))
+        if category_events:
+            changed.add(category)
+            events.extend(category_events)
+    return StockDelta(tuple(events), frozenset(changed))
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+
+def freeze(value):
+    """Return a read-only copy of a parsed JSON value"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Return a plain, JSON serializable copy of a frozen value"""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True)
+class StockSnapshot:
+    version: int
+    fetched_at: float
+    payload: MappingProxyType
+
+    def get(self, key, default=None):
+        return self.payload.get(key, default)
+
+    def items(self):
+        return self.payload.items()
+
+
+class StockFeed:
+    """Fetches the stock endpoint once per tick and fans the snapshot out to every subscriber"""
+
+    def __init__(self, fetch, min_interval=2):
+        self._fetch = fetch
+        self._subscribers = []
+        self._pending = None
+        self._version = 0
+        self.latest = None
+        self.min_interval = min_interval
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return callback
+
+    async def refresh(self, force=False):
+        if not force and self.latest and time.time() - self.latest.fetched_at < self.min_interval:
+            return self.latest
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh())
+            self._pending.add_done_callback(self._clear_pending)
+        return await asyncio.shield(self._pending)
+
+    def restore(self, snapshot):
+        """Adopt a checkpointed snapshot as the latest one without publishing it"""
+        self.latest = snapshot
+        self._version = snapshot.version
+
+    def _clear_pending(self, task):
+        if self._pending is task:
+            self._pending = None
+
+    async def _refresh(self):
+        return await self.push(await self._fetch())
+
+    async def push(self, payload):
+        """Publish a payload that arrived without a fetch, such as from the push feed"""
+        self._version += 1
+        snapshot = StockSnapshot(self._version, time.time(), freeze(payload))
+        self.latest = snapshot
+        await self.publish(snapshot)
+        return snapshot
+
+    async def publish(self, snapshot):
+        results = await asyncio.gather(
+            *(callback(snapshot) for callback in self._subscribers),
+            return_exceptions=True
+        )
+        for callback, result in zip(self._subscribers, results):
+            if isinstance(result, Exception):
+                print(f"Error in {callback.__name__}: {result}")
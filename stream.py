@@ -0,0 +1,71 @@
+import asyncio
+import json
+import random
+
+import aiohttp
+
+import http_client
+import metrics
+
+HEARTBEAT_SECONDS = 30
+
+STREAM_MESSAGES = metrics.Counter('walnut_stream_messages_total', 'Messages received from the push feed')
+STREAM_RECONNECTS = metrics.Counter('walnut_stream_reconnects_total', 'Times the push feed connection was re-opened')
+
+
+class StreamSource:
+    """Reads JSON events from a WebSocket feed and hands each one to handle(message)
+
+    on_state(connected) is called whenever the connection opens or drops, so the pollers
+    can slow down while the feed is live and catch up when it goes away.
+    """
+
+    def __init__(self, url, handle, headers=None, on_state=None, min_delay=1, max_delay=60):
+        self.url = url
+        self.handle = handle
+        self.headers = headers
+        self.on_state = on_state
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.connected = False
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _set_connected(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            if self.on_state:
+                self.on_state(connected)
+
+    async def _run(self):
+        delay = self.min_delay
+        while True:
+            try:
+                async with http_client.get_session().ws_connect(
+                    self.url, headers=self.headers, heartbeat=HEARTBEAT_SECONDS
+                ) as ws:
+                    print(f"Connected to push feed {self.url}")
+                    self._set_connected(True)
+                    delay = self.min_delay
+                    async for message in ws:
+                        if message.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        STREAM_MESSAGES.inc()
+                        try:
+                            await self.handle(json.loads(message.data))
+                        except Exception as e:
+                            print(f"Error handling push feed message: {e}")
+            except Exception as e:
+                print(f"Push feed unavailable: {e!r}")
+            self._set_connected(False)
+            STREAM_RECONNECTS.inc()
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay = min(delay * 2, self.max_delay)
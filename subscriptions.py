@@ -0,0 +1,40 @@
+FEEDS = ('stock', 'eventshop', 'merchant', 'seed', 'gear', 'egg', 'weather', 'weather_updates')
+
+
+def guild_key(guild_id, key):
+    return f'{guild_id}:{key}'
+
+
+class SubscriptionRegistry:
+    """Maps every guild to the channel it uses for each feed, with a reverse index per feed"""
+
+    def __init__(self, data):
+        self.data = data
+        self._by_feed = {feed: {} for feed in FEEDS}
+        for guild_id, feeds in data.items():
+            for feed, channel_id in feeds.items():
+                self._by_feed.setdefault(feed, {})[guild_id] = channel_id
+
+    def subscribe(self, guild_id, feed, channel_id):
+        guild_id = str(guild_id)
+        self.data.setdefault(guild_id, {})[feed] = channel_id
+        self._by_feed.setdefault(feed, {})[guild_id] = channel_id
+
+    def unsubscribe(self, guild_id, feed):
+        guild_id = str(guild_id)
+        self.data.get(guild_id, {}).pop(feed, None)
+        self._by_feed.get(feed, {}).pop(guild_id, None)
+        if guild_id in self.data and not self.data[guild_id]:
+            del self.data[guild_id]
+
+    def remove_guild(self, guild_id):
+        guild_id = str(guild_id)
+        for feed in list(self.data.get(guild_id, {})):
+            self.unsubscribe(guild_id, feed)
+
+    def channel_for(self, guild_id, feed):
+        return self.data.get(str(guild_id), {}).get(feed)
+
+    def channels(self, feed):
+        """Return (guild_id, channel_id) pairs subscribed to feed"""
+        return list(self._by_feed.get(feed, {}).items())
@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import discord
+
+import metrics
+
+MAX_WATCHES_PER_USER = 25
+
+DM_RESULTS = metrics.Counter('walnut_watch_dms_total', 'Watchlist DMs by outcome', ('result',))
+DM_WAIT = metrics.Histogram('walnut_watch_dm_wait_seconds', 'Time a watchlist DM waited before it was sent')
+
+
+class Watchlist:
+    """Inverted index from item_id to the users watching it
+
+    data is the persisted {item_id: {user_id: watched_at}} document and notified the persisted
+    {item_id:start: end} document of rotations already sent; both are updated in place.
+    """
+
+    def __init__(self, data, notified):
+        self.data = data
+        self._by_user = {}
+        self.notified = notified
+        for item_id, users in data.items():
+            for user_id in users:
+                self._by_user.setdefault(user_id, set()).add(item_id)
+
+    def items_for(self, user_id):
+        return sorted(self._by_user.get(str(user_id), ()))
+
+    def watch(self, user_id, item_id):
+        """Add item_id to the user's watchlist and return False when the user is at the limit"""
+        user_id = str(user_id)
+        items = self._by_user.setdefault(user_id, set())
+        if item_id not in items and len(items) >= MAX_WATCHES_PER_USER:
+            return False
+        items.add(item_id)
+        self.data.setdefault(item_id, {})[user_id] = int(time.time())
+        return True
+
+    def unwatch(self, user_id, item_id):
+        user_id = str(user_id)
+        users = self.data.get(item_id, {})
+        if users.pop(user_id, None) is None:
+            return False
+        if not users:
+            del self.data[item_id]
+        self._by_user[user_id].discard(item_id)
+        if not self._by_user[user_id]:
+            del self._by_user[user_id]
+        return True
+
+    def remove_user(self, user_id):
+        for item_id in self.items_for(user_id):
+            self.unwatch(user_id, item_id)
+
+    def match(self, item_ids):
+        """Return {user_id: [item_id, ...]} for the watchers of item_ids, touching only those items"""
+        matches = {}
+        for item_id in item_ids:
+            for user_id in self.data.get(item_id, ()):
+                matches.setdefault(user_id, []).append(item_id)
+        return matches
+
+    def first_notice(self, key, expires):
+        """Return True the first time key is seen, remembering it until expires"""
+        if key in self.notified:
+            return False
+        self.notified[key] = expires
+        return True
+
+    def prune(self, now):
+        expired = [key for key, expires in self.notified.items() if (expires or 0) <= now]
+        for key in expired:
+            del self.notified[key]
+        return bool(expired)
+
+
+class DirectMessenger:
+    """Sends DMs from a small pool of workers, paced to stay under Discord's DM rate limits"""
+
+    def __init__(self, client, workers=4, per_second=5, attempts=3, on_undeliverable=None):
+        self.client = client
+        self.workers = workers
+        self.interval = 1 / per_second
+        self.attempts = attempts
+        self.on_undeliverable = on_undeliverable
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._next_slot = 0
+        self._pace_lock = asyncio.Lock()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def send(self, user_id, **kwargs):
+        self._queue.put_nowait((int(user_id), kwargs, time.perf_counter()))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def join(self):
+        if self._tasks:
+            await self._queue.join()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _pace(self):
+        async with self._pace_lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _work(self):
+        while True:
+            user_id, kwargs, queued_at = await self._queue.get()
+            try:
+                DM_WAIT.observe(time.perf_counter() - queued_at)
+                await self._deliver(user_id, kwargs)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, user_id, kwargs):
+        for attempt in range(self.attempts):
+            await self._pace()
+            try:
+                user = self.client.get_user(user_id) or await self.client.fetch_user(user_id)
+                await user.send(**kwargs)
+                DM_RESULTS.inc(result='sent')
+                return
+            except (discord.Forbidden, discord.NotFound):
+                # DMs closed or the account is gone; retrying will not help
+                DM_RESULTS.inc(result='undeliverable')
+                if self.on_undeliverable:
+                    self.on_undeliverable(user_id)
+                return
+            except (discord.HTTPException, discord.RateLimited) as e:
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is None and getattr(e, 'status', 500) < 500:
+                    break
+                if attempt < self.attempts - 1:
+                    DM_RESULTS.inc(result='retried')
+                    await asyncio.sleep(retry_after or 2 ** attempt)
+        DM_RESULTS.inc(result='failed')
+        print(f"Error sending watchlist DM to {user_id}")
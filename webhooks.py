@@ -0,0 +1,62 @@
+import discord
+
+import http_client
+
+
+class WebhookBackend:
+    """Delivers messages for channels that have a webhook, over the shared HTTP session
+
+    data is the persisted document: 'urls' maps channel_id -> webhook URL and 'owners' maps
+    a message key -> the id of the webhook that posted the message stored under that key.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.urls = data.setdefault('urls', {})
+        self.owners = data.setdefault('owners', {})
+        self._webhooks = {}
+
+    def set_url(self, channel_id, url):
+        self.urls[str(channel_id)] = url
+        self._webhooks.pop(str(channel_id), None)
+
+    def remove(self, channel_id):
+        self.urls.pop(str(channel_id), None)
+        self._webhooks.pop(str(channel_id), None)
+
+    def for_channel(self, channel_id):
+        """Return the Webhook used for channel_id, or None when the channel posts as the bot"""
+        url = self.urls.get(str(channel_id))
+        if not url:
+            return None
+        session = http_client.get_session()
+        webhook = self._webhooks.get(str(channel_id))
+        if webhook is None or webhook.session is not session:
+            webhook = discord.Webhook.from_url(url, session=session)
+            self._webhooks[str(channel_id)] = webhook
+        return webhook
+
+    def owner(self, key):
+        return self.owners.get(key)
+
+    async def send_or_edit(self, webhook, message_id, key, files=list, **kwargs):
+        """Edit message_id through webhook, or post a new message if it is missing; returns the message id
+
+        files() builds the attachments and is called once per request, since a discord.File can only be sent once.
+        """
+        if message_id:
+            try:
+                await webhook.edit_message(int(message_id), attachments=files(), **kwargs)
+                return message_id
+            except discord.NotFound:
+                pass
+        message = await webhook.send(wait=True, files=files(), **kwargs)
+        self.owners[key] = webhook.id
+        return message.id
+
+    async def delete(self, webhook, message_id, key):
+        try:
+            await webhook.delete_message(int(message_id))
+        except discord.NotFound:
+            pass
+        self.owners.pop(key, None)